@@ -0,0 +1,70 @@
+"""
+Measures NearDuplicateIndex lookup latency with a large stored question bank.
+
+Usage:
+    python benchmarks/bench_dedup_index.py [stored_questions] [queries]
+"""
+import os
+import sys
+import time
+import random
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "exam-generator-api"))
+
+from dedup_index import NearDuplicateIndex  # noqa: E402
+
+VOCAB = [f"term{i}" for i in range(5000)]
+TEMPLATES = [
+    "Which of the following best describes {0} in the context of {1} and {2}?",
+    "Explain how {0} affects {1} when {2} is {3}.",
+    "True or false: {0} always guarantees {1} for every {2}.",
+    "Compute the {0} of {1} given {2} and {3}.",
+]
+
+
+def make_question(rng):
+    words = rng.sample(VOCAB, 8)
+    return rng.choice(TEMPLATES).format(*words[:4]) + " " + " ".join(words[4:])
+
+
+def main():
+    stored = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    queries = int(sys.argv[2]) if len(sys.argv) > 2 else 2_000
+    rng = random.Random(7)
+    index = NearDuplicateIndex()
+
+    bank = [make_question(rng) for _ in range(stored)]
+    start = time.perf_counter()
+    for text in bank:
+        index.add(text)
+    build = time.perf_counter() - start
+
+    # Half near-duplicates of stored questions (one word changed), half new.
+    probes = []
+    for i in range(queries):
+        if i % 2:
+            words = rng.choice(bank).split()
+            words[rng.randrange(len(words))] = "changed"
+            probes.append((" ".join(words), True))
+        else:
+            probes.append((make_question(rng), False))
+
+    latencies = []
+    found = {True: 0, False: 0}
+    for text, is_dup in probes:
+        start = time.perf_counter()
+        hit = index.query(text) is not None
+        latencies.append(time.perf_counter() - start)
+        found[is_dup] += hit
+
+    latencies.sort()
+    pct = lambda p: latencies[int(p * (len(latencies) - 1))] * 1e6
+    print(f"stored {len(index)} questions in {build:.1f}s ({build / stored * 1e6:.0f} us/insert)")
+    print(f"query latency: p50 {pct(0.5):.0f} us, p95 {pct(0.95):.0f} us, p99 {pct(0.99):.0f} us")
+    print(f"near-duplicates detected: {found[True]}/{queries // 2}, "
+          f"false positives on new questions: {found[False]}/{queries - queries // 2}")
+
+
+if __name__ == "__main__":
+    main()
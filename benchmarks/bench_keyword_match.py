@@ -0,0 +1,122 @@
+"""
+Compares grader.keyword_match (windows and keywords encoded in one batch
+each) with the previous per-pair implementation, which encoded every
+(window, keyword) pair separately, and checks both return the same keywords.
+The batched version is timed with the keyword embedding cache emptied before
+every answer (cold) and with it kept across answers (warm, as when grading a
+class against one answer key).
+
+Usage:
+    python benchmarks/bench_keyword_match.py [answers] [words_per_answer]
+
+Needs sentence-transformers, rake-nltk and the embedding model weights.
+"""
+import os
+import sys
+import time
+import random
+import statistics
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import grader  # noqa: E402
+from embedding_cache import EMBEDDING_CACHE  # noqa: E402
+
+REFERENCE_ANSWERS = [
+    "The scheduler selects the next runnable process according to its priority, "
+    "and a higher priority process preempts a lower priority one at the next clock interrupt.",
+    "Paging divides virtual memory into fixed size pages mapped to physical frames, "
+    "which avoids external fragmentation but can cause internal fragmentation.",
+    "A deadlock requires mutual exclusion, hold and wait, no preemption and circular wait; "
+    "breaking any one of these conditions prevents it.",
+]
+VOCAB = (
+    "the process scheduler picks next runnable priority higher lower preempts clock interrupt "
+    "memory pages frames virtual physical fragmentation internal external deadlock mutual "
+    "exclusion hold wait circular preemption condition kernel thread queue because when it"
+).split()
+
+
+def per_pair_similarity(a, b):
+    """get_similarity as it was before caching: both texts encoded together."""
+    from sentence_transformers import util
+    embeddings = grader.get_model().encode([a, b], convert_to_tensor=True)
+    return util.pytorch_cos_sim(embeddings[0], embeddings[1]).item()
+
+
+def per_pair_keyword_match(student_ans, rake_keywords, threshold=0.7):
+    """keyword_match as it was before batching: one encode call per pair."""
+    matched = []
+    student_chunks = student_ans.lower().split()
+
+    windows = []
+    for i in range(len(student_chunks) - 1):
+        windows.append(" ".join(student_chunks[i:i+2]))
+    for i in range(len(student_chunks) - 2):
+        windows.append(" ".join(student_chunks[i:i+3]))
+
+    for keyword in rake_keywords:
+        for chunk in windows:
+            score = per_pair_similarity(chunk, keyword)
+            if score >= threshold:
+                matched.append(keyword)
+                break
+    return matched
+
+
+def make_answer(rng, reference, words):
+    # Half copied from the reference, half noise, so some keywords match.
+    copied = reference.lower().split()[: words // 2]
+    return " ".join(copied + rng.choices(VOCAB, k=words - len(copied)))
+
+
+def time_answers(match, cases, cold=False):
+    times, results = [], []
+    for answer, keywords in cases:
+        if cold:
+            EMBEDDING_CACHE.clear()
+        start = time.perf_counter()
+        results.append(match(answer, keywords))
+        times.append(time.perf_counter() - start)
+    return times, results
+
+
+def main():
+    answers = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    words = int(sys.argv[2]) if len(sys.argv) > 2 else 60
+    rng = random.Random(7)
+
+    grader.warm_up()
+    cases = []
+    for i in range(answers):
+        reference = REFERENCE_ANSWERS[i % len(REFERENCE_ANSWERS)]
+        cases.append((make_answer(rng, reference, words), grader.extract_keywords(reference)))
+    grader.keyword_match(*cases[0])  # first-call overhead
+
+    per_pair_times, per_pair_results = time_answers(per_pair_keyword_match, cases)
+    cold_times, cold_results = time_answers(grader.keyword_match, cases, cold=True)
+    EMBEDDING_CACHE.clear()
+    warm_times, warm_results = time_answers(grader.keyword_match, cases)
+
+    keywords = statistics.mean(len(k) for _, k in cases)
+    windows = 2 * words - 3
+    print(f"{answers} answers of {words} words, {keywords:.1f} keywords each "
+          f"({windows} windows, {windows * keywords:.0f} pairs per answer)")
+    print(f"{'implementation':<14} {'median ms/answer':>17} {'mean ms/answer':>15}")
+    rows = (("per-pair", per_pair_times), ("batched cold", cold_times), ("batched warm", warm_times))
+    for name, times in rows:
+        print(f"{name:<14} {statistics.median(times) * 1000:>17.1f} {statistics.mean(times) * 1000:>15.1f}")
+    for name, times in rows[1:]:
+        print(f"speedup, {name}: {statistics.median(per_pair_times) / statistics.median(times):.1f}x")
+
+    mismatches = sum(
+        a != b or a != c for a, b, c in zip(per_pair_results, cold_results, warm_results)
+    )
+    print(f"answers with different matched keywords: {mismatches}")
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
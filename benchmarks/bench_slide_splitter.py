@@ -0,0 +1,97 @@
+"""
+Micro-benchmark: per-slide BeautifulSoup extraction vs the single-pass
+iter_slide_texts() parser on a synthetic document-parse HTML deck.
+
+Usage:
+    python benchmarks/bench_slide_splitter.py [pages] [repeats]
+"""
+import os
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "exam-generator-api"))
+os.environ.setdefault("UPSTAGE_API_KEY", "offline")
+
+from generator import (  # noqa: E402
+    clean_text,
+    extract_text_from_html,
+    iter_slide_texts,
+    preprocess_slides,
+)
+
+
+def synthetic_html(pages):
+    parts = []
+    for i in range(1, pages + 1):
+        rows = "".join(
+            f"<tr><td>{r}</td><td>Latency &amp; throughput of stage {r} — 처리량 {r * i}</td></tr>"
+            for r in range(1, 6)
+        )
+        parts.append(
+            f"<header id='{i}'>Lecture 6</header>"
+            f"<h1 id='h{i}'>Slide {i}: Virtual memory</h1>"
+            f"<p id='p{i}'>Page tables map virtual pages to physical frames.\n"
+            f"A TLB caches recent translations ✓ to avoid walking the table.</p>"
+            f"<table id='t{i}'>{rows}</table>"
+            f"<footer id='f{i}'>{i}</footer>"
+        )
+    return "\n".join(parts)
+
+
+def boundary_html(pages):
+    """Long text nodes, so feed() chunk boundaries fall inside words and comments split nodes."""
+    words = ["equilibrium", "thermodynamics", "reaction", "entropy", "처리량", "catalyst"]
+    return "\n".join(
+        f"<h1>Slide {i}</h1><p>{' '.join(words[(i + k) % len(words)] for k in range(40 + i % 300))}"
+        f"<!-- note -->tail {i} &amp; more</p><footer>{i}</footer>"
+        for i in range(1, pages + 1)
+    )
+
+
+def old_path(html_input):
+    return [clean_text(extract_text_from_html(chunk)) for chunk in preprocess_slides(html_input)]
+
+
+def new_path(html_input):
+    return list(iter_slide_texts(html_input))
+
+
+def measure(fn, html_input, repeats):
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn(html_input)
+        best = min(best, time.perf_counter() - start)
+
+    tracemalloc.start()
+    fn(html_input)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak
+
+
+def main():
+    pages = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    html_input = synthetic_html(pages)
+
+    assert old_path(html_input) == new_path(html_input), "outputs differ"
+    tricky = boundary_html(pages)
+    for chunk_size in (64 * 1024, 4096, 7, 1):
+        assert old_path(tricky) == list(iter_slide_texts(tricky, chunk_size)), \
+            f"outputs differ with text split across {chunk_size}-character chunks"
+
+    old_time, old_peak = measure(old_path, html_input, repeats)
+    new_time, new_peak = measure(new_path, html_input, repeats)
+
+    print(f"{pages} pages, {len(html_input) / 1024:.0f} KiB of HTML, best of {repeats}")
+    print(f"{'path':<28} {'time (ms)':>10} {'peak alloc (KiB)':>17}")
+    print(f"{'split + soup per slide':<28} {old_time * 1000:>10.1f} {old_peak / 1024:>17.0f}")
+    print(f"{'iter_slide_texts':<28} {new_time * 1000:>10.1f} {new_peak / 1024:>17.0f}")
+    print(f"speedup: {old_time / new_time:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
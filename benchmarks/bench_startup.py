@@ -0,0 +1,90 @@
+"""
+Measures cold import and app startup time of the grading and generation
+modules, each in a fresh interpreter.
+
+Usage:
+    python benchmarks/bench_startup.py [--runs 5] [--budget 2.0] [--warm-up]
+
+--budget fails (exit 1) when any target's median exceeds that many seconds.
+--warm-up also times grader.warm_up(), which loads the embedding and NLI
+models (needs sentence-transformers/transformers and the weights).
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# (name, working directory, code timed in a fresh interpreter)
+TARGETS = [
+    ("import grader", ROOT, "import grader"),
+    ("import exam_grader (no API key)", "exam-grader-api", "import exam_grader"),
+    ("grader app startup", "exam-grader-api",
+     "import main\nfrom fastapi.testclient import TestClient\nwith TestClient(main.app): pass"),
+    ("generator app startup", "exam-generator-api",
+     "import main\nfrom fastapi.testclient import TestClient\nwith TestClient(main.app): pass"),
+]
+WARM_UP_TARGET = ("grader.warm_up()", ROOT, "import grader\ngrader.warm_up()")
+
+RUNNER = """
+import sys, time, json
+start = time.perf_counter()
+exec(compile(sys.argv[1], "<target>", "exec"))
+print(json.dumps(time.perf_counter() - start))
+"""
+
+
+def time_target(cwd, code, env):
+    result = subprocess.run(
+        [sys.executable, "-c", RUNNER, code],
+        cwd=os.path.join(ROOT, cwd), env=env, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr else "failed")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget", type=float)
+    parser.add_argument("--warm-up", action="store_true")
+    options = parser.parse_args()
+
+    targets = TARGETS + ([WARM_UP_TARGET] if options.warm_up else [])
+    over_budget = []
+    with tempfile.TemporaryDirectory(prefix="startup_") as workdir:
+        env = dict(
+            os.environ,
+            PARSE_CACHE_DIR=os.path.join(workdir, "parse_cache"),
+            SUMMARY_CACHE_DIR=os.path.join(workdir, "summary_cache"),
+            QUESTION_BANK_PATH=os.path.join(workdir, "question_bank.db"),
+            JOBS_DIR=os.path.join(workdir, "jobs"),
+        )
+        env.setdefault("UPSTAGE_API_KEY", "offline")
+        no_key_env = {k: v for k, v in env.items() if k != "UPSTAGE_API_KEY"}
+
+        print(f"{'target':<34} {'median s':>9} {'min s':>9} {'max s':>9}")
+        for name, cwd, code in targets:
+            target_env = no_key_env if "no API key" in name else env
+            try:
+                times = [time_target(cwd, code, target_env) for _ in range(options.runs)]
+            except RuntimeError as e:
+                print(f"{name:<34} skipped: {e}")
+                continue
+            median = statistics.median(times)
+            print(f"{name:<34} {median:>9.3f} {min(times):>9.3f} {max(times):>9.3f}")
+            if options.budget is not None and median > options.budget:
+                over_budget.append(name)
+
+    if over_budget:
+        print(f"Over the {options.budget}s budget: {', '.join(over_budget)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,269 @@
+"""
+End-to-end throughput benchmark for /generate_exam/ and /grade against the
+local Upstage stand-in (benchmarks/mock_upstage.py).
+
+Usage:
+    python benchmarks/load_test.py [--concurrency 1,2,4,8] [--requests 16]
+        [--endpoints generate,grade] [--cold] [--json results.json]
+        [--baseline results.json --tolerance 0.25] [mock options, e.g. --chat-latency fixed:0.2]
+
+Starts the mock and both services as subprocesses with caches, question bank
+and job store in a temp directory, then sends --requests requests per
+concurrency level and reports p50/p95/p99 latency and requests per second.
+Pass --generator-url/--grader-url to drive already running services instead
+(they must point UPSTAGE_BASE_URL at the mock themselves).
+
+--cold appends a unique trailer to every uploaded PDF, so parse and summary
+caches never hit. With --baseline, exits non-zero when a level's p95 or RPS
+is worse than the baseline run by more than --tolerance.
+"""
+import os
+import sys
+import glob
+import json
+import time
+import uuid
+import socket
+import asyncio
+import argparse
+import tempfile
+import subprocess
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+from mock_upstage import parse_args as parse_mock_args  # noqa: E402
+
+MOCK_OPTIONS = ["--parse-latency", "--ocr-latency", "--chat-latency", "--error-rate",
+                "--rate-limit-rate", "--malformed-rate", "--seed"]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_until_up(url, process, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"{url} exited with code {process.returncode}")
+        try:
+            httpx.get(url, timeout=1)
+            return
+        except httpx.TransportError:
+            time.sleep(0.2)
+    raise RuntimeError(f"{url} did not start within {timeout}s")
+
+
+def start_process(args, cwd, env, url):
+    # The services print progress lines per request; keep only stderr.
+    process = subprocess.Popen(args, cwd=cwd, env=env, stdout=subprocess.DEVNULL)
+    wait_until_up(url, process)
+    return process
+
+
+def start_stack(options, workdir):
+    """Starts the mock and both services; returns (processes, generator_url, grader_url)."""
+    processes = []
+    mock_port = free_port()
+    mock_args = [sys.executable, os.path.join(ROOT, "benchmarks", "mock_upstage.py"), "--port", str(mock_port)]
+    for flag in MOCK_OPTIONS:
+        mock_args += [flag, str(getattr(options, flag[2:].replace("-", "_")))]
+    processes.append(start_process(mock_args, ROOT, os.environ.copy(), f"http://127.0.0.1:{mock_port}/stats"))
+
+    env = dict(
+        os.environ,
+        UPSTAGE_API_KEY="mock",
+        UPSTAGE_BASE_URL=f"http://127.0.0.1:{mock_port}/v1",
+        PARSE_CACHE_DIR=os.path.join(workdir, "parse_cache"),
+        SUMMARY_CACHE_DIR=os.path.join(workdir, "summary_cache"),
+        QUESTION_BANK_PATH=os.path.join(workdir, "question_bank.db"),
+        JOBS_DIR=os.path.join(workdir, "jobs"),
+        UPLOAD_TMP_DIR=workdir,
+    )
+    urls = []
+    for service in ("exam-generator-api", "exam-grader-api"):
+        port = free_port()
+        url = f"http://127.0.0.1:{port}"
+        processes.append(start_process(
+            [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+             "--log-level", "warning"],
+            os.path.join(ROOT, service), env, f"{url}/docs"
+        ))
+        urls.append(url)
+    return processes, urls[0], urls[1]
+
+
+def sample_pdf(folder):
+    paths = sorted(glob.glob(os.path.join(ROOT, folder, "*.pdf")))
+    if not paths:
+        raise SystemExit(f"No sample PDFs in {folder}/")
+    with open(paths[0], "rb") as f:
+        return os.path.basename(paths[0]), f.read()
+
+
+def upload_bytes(data, cold):
+    # Bytes after %%EOF are ignored by PDF readers but change the file hash.
+    return data + f"\n%{uuid.uuid4().hex}\n".encode() if cold else data
+
+
+def generate_request(lecture, cold):
+    filename, data = lecture
+    counts = {filename: {"mcq": 2, "tf": 1, "sa": 1}}
+    return {
+        "url": "/generate_exam/",
+        "files": [("files", (filename, upload_bytes(data, cold), "application/pdf"))],
+        "data": {"detail_level": "medium", "question_counts": json.dumps(counts)},
+    }
+
+
+def grade_request(exam_paper, answer_key, cold):
+    return {
+        "url": "/grade",
+        "files": [
+            ("student_file", (exam_paper[0], upload_bytes(exam_paper[1], cold), "application/pdf")),
+            ("answer_key", (answer_key[0], upload_bytes(answer_key[1], cold), "application/pdf")),
+        ],
+    }
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(q / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+async def run_level(base_url, make_request, concurrency, total):
+    latencies = []
+    errors = 0
+    next_index = 0
+
+    async def worker(client):
+        nonlocal errors, next_index
+        while next_index < total:
+            next_index += 1
+            request = make_request()
+            start = time.perf_counter()
+            try:
+                response = await client.post(request["url"], files=request["files"], data=request.get("data"))
+                ok = response.status_code == 200 and "error" not in response.text[:200]
+            except httpx.HTTPError:
+                ok = False
+            latencies.append(time.perf_counter() - start)
+            if not ok:
+                errors += 1
+
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=600, limits=limits) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "concurrency": concurrency,
+        "requests": total,
+        "errors": errors,
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+        "rps": total / elapsed,
+    }
+
+
+def print_results(name, results):
+    print(f"\n{name}")
+    print(f"{'conc':>5} {'reqs':>5} {'errors':>6} {'p50 s':>8} {'p95 s':>8} {'p99 s':>8} {'req/s':>8}")
+    for r in results:
+        print(f"{r['concurrency']:>5} {r['requests']:>5} {r['errors']:>6} "
+              f"{r['p50']:>8.3f} {r['p95']:>8.3f} {r['p99']:>8.3f} {r['rps']:>8.2f}")
+
+
+def regressions(results, baseline, tolerance):
+    """Lists levels whose p95 or throughput is worse than the baseline beyond tolerance."""
+    found = []
+    for endpoint, levels in results.items():
+        previous = {r["concurrency"]: r for r in baseline.get(endpoint, [])}
+        for r in levels:
+            old = previous.get(r["concurrency"])
+            if old is None:
+                continue
+            if r["p95"] > old["p95"] * (1 + tolerance):
+                found.append(f"{endpoint} c={r['concurrency']}: p95 {old['p95']:.3f}s -> {r['p95']:.3f}s")
+            if r["rps"] < old["rps"] * (1 - tolerance):
+                found.append(f"{endpoint} c={r['concurrency']}: {old['rps']:.2f} -> {r['rps']:.2f} req/s")
+    return found
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", default="1,2,4,8")
+    parser.add_argument("--requests", type=int, default=16, help="requests per concurrency level")
+    parser.add_argument("--endpoints", default="generate,grade")
+    parser.add_argument("--cold", action="store_true", help="defeat parse/summary caches")
+    parser.add_argument("--generator-url")
+    parser.add_argument("--grader-url")
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--baseline", help="results file of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    options, mock_argv = parser.parse_known_args(argv)
+    # Unknown flags are mock options; parse them with the mock's own defaults.
+    for key, value in vars(parse_mock_args(mock_argv)).items():
+        setattr(options, key, value)
+    return options
+
+
+def main(argv=None):
+    options = parse_args(sys.argv[1:] if argv is None else argv)
+    levels = [int(c) for c in options.concurrency.split(",")]
+    endpoints = options.endpoints.split(",")
+
+    lecture = sample_pdf("answerKey")
+    exam_paper = sample_pdf("examPapers")
+    answer_key = sample_pdf("answerKey")
+    factories = {
+        "generate": lambda: generate_request(("lecture.pdf", lecture[1]), options.cold),
+        "grade": lambda: grade_request(exam_paper, answer_key, options.cold),
+    }
+
+    processes = []
+    with tempfile.TemporaryDirectory(prefix="loadtest_") as workdir:
+        try:
+            if options.generator_url and options.grader_url:
+                generator_url, grader_url = options.generator_url, options.grader_url
+            else:
+                processes, generator_url, grader_url = start_stack(options, workdir)
+            base_urls = {"generate": generator_url, "grade": grader_url}
+
+            results = {}
+            for endpoint in endpoints:
+                results[endpoint] = [
+                    asyncio.run(run_level(base_urls[endpoint], factories[endpoint], level, options.requests))
+                    for level in levels
+                ]
+                print_results(f"/{'generate_exam/' if endpoint == 'generate' else 'grade'}", results[endpoint])
+        finally:
+            for process in processes:
+                process.terminate()
+            for process in processes:
+                process.wait()
+
+    if options.json:
+        with open(options.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+    if options.baseline:
+        with open(options.baseline, encoding="utf-8") as f:
+            found = regressions(results, json.load(f), options.tolerance)
+        for line in found:
+            print(f"REGRESSION {line}")
+        if found:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
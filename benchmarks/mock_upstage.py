@@ -0,0 +1,236 @@
+"""
+Local stand-in for the Upstage document-digitization, OCR and Solar
+chat-completions endpoints, for load-testing the services without API quota.
+
+Usage:
+    python benchmarks/mock_upstage.py [--port 8900] [--parse-latency lognormal:1.5,0.4]
+        [--ocr-latency lognormal:0.8,0.3] [--chat-latency lognormal:2.0,0.5]
+        [--error-rate 0.0] [--rate-limit-rate 0.0] [--malformed-rate 0.0] [--seed 0]
+
+Point a service at it with UPSTAGE_BASE_URL=http://127.0.0.1:8900/v1.
+
+Latencies are fixed:S, uniform:A,B or lognormal:MEDIAN,SIGMA in seconds.
+--error-rate answers that share of calls with 503 and --rate-limit-rate with
+429 (Retry-After: 1). --malformed-rate truncates that share of generated
+question arrays mid-object, to exercise the salvage path.
+
+Parse responses are built from the sample PDFs in examPapers/ and answerKey/:
+every page becomes a slide for lecture uploads, and files whose name starts
+with "answerKey" get an answer table with one row per question of the sample
+exam paper. OCR returns a student answer sheet for the same questions.
+"""
+import os
+import re
+import sys
+import json
+import glob
+import math
+import time
+import html
+import random
+import asyncio
+import argparse
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CANNED_ANSWERS = ["B", "True", "42", "The scheduler picks the next runnable process by priority"]
+CANNED_STUDENT_ANSWERS = ["B", "False", "42", "It chooses the process with the highest priority"]
+VOCAB = [
+    "scheduler", "process", "thread", "kernel", "memory", "page", "cache", "interrupt",
+    "deadlock", "semaphore", "mutex", "priority", "quantum", "context", "switch", "queue",
+    "latency", "throughput", "register", "stack", "heap", "file", "inode", "disk",
+    "buffer", "signal", "pipe", "socket", "virtual", "address", "segment", "fault",
+]
+
+
+def parse_distribution(spec):
+    """Returns a zero-argument sampler for fixed:S, uniform:A,B or lognormal:MEDIAN,SIGMA."""
+    kind, _, args = spec.partition(":")
+    values = [float(v) for v in args.split(",") if v]
+    if kind == "fixed":
+        return lambda: values[0]
+    if kind == "uniform":
+        return lambda: random.uniform(values[0], values[1])
+    if kind == "lognormal":
+        mu, sigma = math.log(values[0]), values[1]
+        return lambda: random.lognormvariate(mu, sigma)
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+def pdf_pages(path):
+    from pypdf import PdfReader
+    return [" ".join((page.extract_text() or "").split()) for page in PdfReader(path).pages]
+
+
+def build_canned_responses():
+    exam_papers = sorted(glob.glob(os.path.join(ROOT, "examPapers", "*.pdf")))
+    answer_keys = sorted(glob.glob(os.path.join(ROOT, "answerKey", "*.pdf")))
+
+    slides = []
+    for path in answer_keys + exam_papers:
+        slides.extend(text for text in pdf_pages(path) if text)
+    lecture_html = "".join(
+        f"<h2>Slide {i}</h2><p>{html.escape(text)}</p><footer>{i}</footer>"
+        for i, text in enumerate(slides, start=1)
+    )
+
+    exam_text = " ".join(pdf_pages(exam_papers[0])) if exam_papers else ""
+    question_count = len(re.findall(r"(?:^|\s)\d+\.", exam_text)) or 2
+    rows = "".join(
+        f"<tr><td>{q}</td><td>{CANNED_ANSWERS[(q - 1) % len(CANNED_ANSWERS)]}</td></tr>"
+        for q in range(1, question_count + 1)
+    )
+    answer_key_html = f"<table><tr><th>Question</th><th>Answer</th></tr>{rows}</table>"
+
+    sheet = "\n".join(
+        f"{q}. {CANNED_STUDENT_ANSWERS[(q - 1) % len(CANNED_STUDENT_ANSWERS)]}"
+        for q in range(1, question_count + 1)
+    )
+    return {
+        "lecture_html": lecture_html,
+        "answer_key_html": answer_key_html,
+        "ocr_text": sheet,
+        "question_count": question_count,
+    }
+
+
+def random_phrase(words=8):
+    return " ".join(random.sample(VOCAB, words))
+
+
+def generated_questions(prompt, malformed):
+    count = int(re.search(r"generate (\d+) ", prompt).group(1))
+    section_type = re.search(r'type \(must be "([^"]+)"\)', prompt).group(1)
+    start = int(re.search(r"starting from (\d+)", prompt).group(1))
+
+    questions = []
+    for number in range(start, start + count):
+        # Random wording keeps the near-duplicate filter from dropping them.
+        question = {
+            "question_number": number,
+            "context": f"Explain how {random_phrase()} relate in question {number}?",
+            "answer": "A" if section_type == "Multiple Choice" else random_phrase(4),
+            "type": section_type,
+        }
+        if section_type == "Multiple Choice":
+            question["choices"] = {key: random_phrase(3) for key in "ABCD"}
+        questions.append(question)
+
+    output = json.dumps(questions, ensure_ascii=False, indent=2)
+    if malformed and count > 1:
+        output = output[: int(len(output) * 0.7)]
+    return output
+
+
+def chat_reply(prompt, settings, canned):
+    if "You are an exam question generator" in prompt:
+        return generated_questions(prompt, random.random() < settings.malformed_rate)
+    if "You are an expert exam parser" in prompt:
+        return json.dumps([
+            {"question_number": q, "question": f"Question {q}",
+             "answer": CANNED_STUDENT_ANSWERS[(q - 1) % len(CANNED_STUDENT_ANSWERS)]}
+            for q in range(1, canned["question_count"] + 1)
+        ])
+    if "You are an exam grading AI" in prompt:
+        ids = [json.loads(line)["id"] for line in prompt.splitlines() if line.startswith('{"id"')]
+        if ids:
+            return json.dumps([{"id": i, "score": random.choice([0, 40, 70, 85, 100])} for i in ids])
+        return str(random.choice([0, 40, 70, 85, 100]))
+    if prompt.rstrip().endswith("Summary:"):
+        return f"This part of the lecture covers {random_phrase(12)}."
+    return "OK"
+
+
+def create_app(settings):
+    app = FastAPI()
+    canned = build_canned_responses()
+    latencies = {
+        "parse": parse_distribution(settings.parse_latency),
+        "ocr": parse_distribution(settings.ocr_latency),
+        "chat": parse_distribution(settings.chat_latency),
+    }
+    counters = {"parse": 0, "ocr": 0, "chat": 0, "errors": 0, "rate_limited": 0}
+
+    async def simulate(kind):
+        """Sleeps for a sampled latency; returns an error response or None."""
+        counters[kind] += 1
+        await asyncio.sleep(latencies[kind]())
+        roll = random.random()
+        if roll < settings.rate_limit_rate:
+            counters["rate_limited"] += 1
+            return JSONResponse({"error": "rate limited"}, status_code=429, headers={"Retry-After": "1"})
+        if roll < settings.rate_limit_rate + settings.error_rate:
+            counters["errors"] += 1
+            return JSONResponse({"error": "upstream unavailable"}, status_code=503)
+        return None
+
+    @app.post("/v1/document-digitization")
+    async def document_digitization(request: Request):
+        form = await request.form()
+        document = form.get("document")
+        filename = getattr(document, "filename", "") or ""
+        if form.get("model") == "ocr":
+            error = await simulate("ocr")
+            return error or JSONResponse({"text": canned["ocr_text"]})
+
+        error = await simulate("parse")
+        if error:
+            return error
+        if os.path.basename(filename).startswith("answerKey"):
+            content = canned["answer_key_html"]
+        else:
+            content = canned["lecture_html"]
+        return JSONResponse({"content": {"html": content}})
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        error = await simulate("chat")
+        if error:
+            return error
+        prompt = body["messages"][-1]["content"]
+        return JSONResponse({
+            "id": f"mock-{counters['chat']}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "solar-pro"),
+            "choices": [{
+                "index": 0,
+                "finish_reason": "stop",
+                "message": {"role": "assistant", "content": chat_reply(prompt, settings, canned)},
+            }],
+            "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": 0, "total_tokens": len(prompt) // 4},
+        })
+
+    @app.get("/stats")
+    async def stats():
+        return counters
+
+    return app
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--parse-latency", default="lognormal:1.5,0.4")
+    parser.add_argument("--ocr-latency", default="lognormal:0.8,0.3")
+    parser.add_argument("--chat-latency", default="lognormal:2.0,0.5")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--malformed-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    import uvicorn
+    settings = parse_args(argv)
+    random.seed(settings.seed)
+    uvicorn.run(create_app(settings), host=settings.host, port=settings.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,115 @@
+"""
+Compares summary LLM calls per deck for fixed 5-slide batches against
+token-budget packing with content-defined boundaries, and how many batches
+get a new cache key (and so a new LLM call) when one slide is edited: the
+"edit" columns give the mean and maximum, over every slide, of the batches
+changed by appending ~150 words to that slide alone.
+
+Usage:
+    python benchmarks/summary_batching_report.py [deck.pdf | parsed.html ...]
+
+PDF pages are treated as slides (text extracted locally with pypdf); .html
+files are document-parse output. Without arguments the sample PDFs in
+examPapers/ and answerKey/ are used, plus a synthetic 60-slide lecture deck
+mixing title-only and bullet slides.
+"""
+import os
+import sys
+import glob
+import html
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "exam-generator-api"))
+os.environ.setdefault("UPSTAGE_API_KEY", "offline")
+
+from generator import (  # noqa: E402
+    SUMMARY_TOKEN_BUDGET,
+    estimate_tokens,
+    pack_slide_texts,
+    slide_texts,
+    summary_cache_key,
+)
+
+
+def load_html(path):
+    if path.lower().endswith(".pdf"):
+        from pypdf import PdfReader
+        pages = PdfReader(path).pages
+        return "".join(
+            f"<p>{html.escape(page.extract_text() or '')}</p><footer>{i}</footer>"
+            for i, page in enumerate(pages, start=1)
+        )
+    with open(path, encoding="utf-8") as f:
+        return f.read()
+
+
+def synthetic_deck(slides=60):
+    parts = []
+    for i in range(1, slides + 1):
+        if i % 4 == 1:
+            body = f"<h1>Week 6 - Part {i // 4 + 1}: Process Scheduling</h1>"
+        else:
+            bullets = "".join(
+                f"<li>Point {j}: the scheduler picks the next runnable process by priority and time slice</li>"
+                for j in range(1, 2 + i % 5)
+            )
+            body = f"<h2>Slide {i}</h2><ul>{bullets}</ul>"
+        parts.append(f"{body}<footer>{i}</footer>")
+    return "".join(parts)
+
+
+def fixed_batches(texts, batch_size=5):
+    return [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+
+
+def prompt_tokens(batch):
+    return estimate_tokens("\n\n".join(batch))
+
+
+EDIT = " ".join(["an added explanation of how the scheduler trades latency for throughput"] * 13)
+
+
+def batches_changed_per_edit(texts, pack):
+    """Mean and max number of batches with a new cache key after editing one slide."""
+    if not texts:
+        return "-"
+    before = {summary_cache_key(batch) for batch in pack(texts)}
+    changed = []
+    for i in range(len(texts)):
+        edited = texts[:i] + [f"{texts[i]} {EDIT}"] + texts[i + 1:]
+        changed.append(sum(summary_cache_key(batch) not in before for batch in pack(edited)))
+    return f"{sum(changed) / len(changed):.2f}/{max(changed)}"
+
+
+def main(paths):
+    use_samples = not paths
+    if use_samples:
+        paths = sorted(glob.glob(os.path.join(ROOT, "examPapers", "*.pdf")))
+        paths += sorted(glob.glob(os.path.join(ROOT, "answerKey", "*.pdf")))
+
+    decks = [(os.path.basename(path), load_html(path)) for path in paths]
+    if use_samples:
+        decks.append(("synthetic-60-slides", synthetic_deck()))
+        decks.append(("synthetic-300-slides", synthetic_deck(300)))
+
+    print(f"token budget: {SUMMARY_TOKEN_BUDGET}")
+    print(f"{'deck':<40} {'slides':>6} {'fixed':>6} {'packed':>6} {'saved':>6} {'max tok fixed':>14} "
+          f"{'max tok packed':>15} {'edit fixed':>11} {'edit packed':>12}")
+    total_fixed = total_packed = 0
+    for name, deck_html in decks:
+        texts = list(slide_texts(deck_html))
+        fixed = fixed_batches(texts)
+        packed = pack_slide_texts(texts)
+        total_fixed += len(fixed)
+        total_packed += len(packed)
+        print(f"{name:<40} {len(texts):>6} {len(fixed):>6} {len(packed):>6} "
+              f"{len(fixed) - len(packed):>6} {max(map(prompt_tokens, fixed), default=0):>14} "
+              f"{max(map(prompt_tokens, packed), default=0):>15} "
+              f"{batches_changed_per_edit(texts, fixed_batches):>11} "
+              f"{batches_changed_per_edit(texts, pack_slide_texts):>12}")
+
+    print(f"{'total':<40} {'':>6} {total_fixed:>6} {total_packed:>6} {total_fixed - total_packed:>6}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
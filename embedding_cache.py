@@ -0,0 +1,152 @@
+import os
+import io
+import json
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+
+# ---- Reference-side cache for the hybrid grader ---- #
+# Every student answer to a question is compared with the same reference
+# answer, so its embedding, its RAKE keywords and their embeddings only need
+# computing once per exam. Entries are keyed by kind (e.g. the embedding model
+# name) and whitespace-normalized text, and evicted least recently used once
+# their total size exceeds EMBEDDING_CACHE_MAX_BYTES. With EMBEDDING_CACHE_DIR
+# set, entries are also written there (.npy for embeddings, .json for keyword
+# lists) and reloaded by later processes.
+
+EMBEDDING_CACHE_MAX_BYTES = int(os.getenv("EMBEDDING_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR") or None
+
+
+def normalize_text(text):
+    """NFKC-normalized text with runs of whitespace collapsed."""
+    return " ".join(unicodedata.normalize("NFKC", str(text)).split())
+
+
+def value_size(value):
+    """Approximate memory held by a cached tensor, array or list of strings."""
+    if hasattr(value, "element_size"):
+        return value.element_size() * value.nelement()
+    if hasattr(value, "nbytes"):
+        return value.nbytes
+    return sum(len(item.encode("utf-8")) + 64 for item in value) + 64
+
+
+class EmbeddingCache:
+    """Size-bounded LRU of embeddings and keyword lists, optionally persisted to disk."""
+
+    def __init__(self, max_bytes=EMBEDDING_CACHE_MAX_BYTES, directory=EMBEDDING_CACHE_DIR):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # (kind, text) -> (value, size), least recent first
+        self._total_bytes = 0
+        self._counters = {}  # kind -> {"hits", "disk_hits", "misses"}
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _count(self, kind, counter):
+        counters = self._counters.setdefault(kind, {"hits": 0, "disk_hits": 0, "misses": 0})
+        counters[counter] += 1
+
+    def _path(self, kind, text):
+        digest = hashlib.sha256(f"{kind}\0{text}".encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, digest)
+
+    def _load(self, kind, text):
+        path = self._path(kind, text)
+        try:
+            with open(f"{path}.json", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            pass
+        import numpy as np
+        try:
+            with open(f"{path}.npy", "rb") as f:
+                array = np.load(f, allow_pickle=False)
+        except FileNotFoundError:
+            return None
+        import torch
+        return torch.from_numpy(array)
+
+    def _save(self, kind, text, value):
+        path = self._path(kind, text)
+        if isinstance(value, list):
+            suffix, data = ".json", json.dumps(value, ensure_ascii=False).encode("utf-8")
+        else:
+            import numpy as np
+            array = value.detach().cpu().numpy() if hasattr(value, "detach") else value
+            buffer = io.BytesIO()
+            np.save(buffer, array, allow_pickle=False)
+            suffix, data = ".npy", buffer.getvalue()
+        tmp_path = f"{path}{suffix}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path + suffix)
+
+    def _store(self, key, value):
+        size = value_size(value)
+        with self._lock:
+            if key in self._entries:
+                self._total_bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (value, size)
+            self._total_bytes += size
+            while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+                _, (_, old_size) = self._entries.popitem(last=False)
+                self._total_bytes -= old_size
+
+    def get(self, kind, text):
+        """Returns the cached value, or None on a miss."""
+        key = (kind, normalize_text(text))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self._count(kind, "hits")
+                return entry[0]
+        value = self._load(*key) if self.directory else None
+        with self._lock:
+            self._count(kind, "misses" if value is None else "disk_hits")
+        if value is not None:
+            self._store(key, value)
+        return value
+
+    def put(self, kind, text, value):
+        key = (kind, normalize_text(text))
+        self._store(key, value)
+        if self.directory:
+            self._save(*key, value)
+
+    def get_or_compute(self, kind, text, compute):
+        """Returns the cached value, or stores and returns compute(normalized text)."""
+        value = self.get(kind, text)
+        if value is None:
+            value = compute(normalize_text(text))
+            self.put(kind, text, value)
+        return value
+
+    def clear(self):
+        """Empties memory (not the disk directory) and resets the counters."""
+        with self._lock:
+            self._entries.clear()
+            self._total_bytes = 0
+            self._counters.clear()
+
+    def stats(self):
+        """Returns hit rates per kind and current memory use."""
+        with self._lock:
+            kinds = {}
+            for kind, counters in self._counters.items():
+                lookups = sum(counters.values())
+                hits = counters["hits"] + counters["disk_hits"]
+                kinds[kind] = dict(counters, hit_rate=hits / lookups if lookups else 0.0)
+            return {
+                "kinds": kinds,
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+EMBEDDING_CACHE = EmbeddingCache()
@@ -0,0 +1,394 @@
+import os
+import asyncio
+import httpx
+from transport import (
+    CircuitOpenError,
+    async_openai_client,
+    async_post_with_retry,
+    http_limits,
+    http_timeout,
+)
+from metrics import traced, current_span
+from disk_cache import PARSE_CACHE, parse_cache_key
+from generator import (
+    PARSE_URL,
+    PARSE_TIMEOUT,
+    PARSE_OPTIONS,
+    read_pdf,
+    MAX_CONCURRENT_SECTIONS,
+    SUMMARY_TOKEN_BUDGET,
+    batch_slide_texts,
+    build_summary_output,
+    build_summary_prompt,
+    build_section_prompt,
+    parse_section_output,
+    build_followup_prompt,
+    section_error,
+    drop_duplicates,
+    freed_numbers,
+    tag_summaries,
+    SECTION_RETRIES,
+    summary_cache_key,
+    is_summary_error,
+    SUMMARY_CACHE,
+    plan_section_tasks,
+    assemble_exam,
+)
+from question_parser import merge_followup
+from pdf_shards import (
+    split_pdf,
+    shard_options,
+    shard_filename,
+    stitch_shards,
+    describe_shard,
+    MAX_CONCURRENT_SHARDS,
+    PARSE_SHARD_RETRIES,
+)
+from dedup_index import NearDuplicateIndex
+from question_bank import QUESTION_BANK, QUESTION_BANK_SURPLUS
+
+# ---- asyncio-native version of the generator pipeline ---- #
+# The endpoint awaits these instead of calling the blocking functions in
+# generator.py, so one exam request never stalls the event loop for others.
+# The semaphores are process-wide: they bound the total fan-out across all
+# concurrent requests, not per request.
+
+MAX_CONCURRENT_PARSES = int(os.getenv("MAX_CONCURRENT_PARSES", "4"))
+MAX_CONCURRENT_LLM_CALLS = int(os.getenv("MAX_CONCURRENT_LLM_CALLS", "8"))
+
+parse_semaphore = asyncio.Semaphore(MAX_CONCURRENT_PARSES)
+llm_semaphore = asyncio.Semaphore(MAX_CONCURRENT_LLM_CALLS)
+
+async_client = async_openai_client()
+
+_http_client = None
+
+def get_http_client():
+    """Returns the shared keep-alive HTTP client used for document parsing."""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(timeout=http_timeout(PARSE_TIMEOUT), limits=http_limits())
+    return _http_client
+
+async def close_http_client():
+    """Closes the shared HTTP client; called on application shutdown."""
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+async def post_parse_request_async(filename, pdf_bytes, options=PARSE_OPTIONS, retries=PARSE_SHARD_RETRIES):
+    """Sends one PDF to the document parser and returns its HTML."""
+    headers = {"Authorization": f"Bearer {async_client.api_key}"}
+    files = {"document": (filename, pdf_bytes)}
+    response = await async_post_with_retry(get_http_client(), PARSE_URL, retries=retries, limiter=parse_semaphore,
+                                           headers=headers, files=files, data=options)
+    return response.json().get("content", {}).get("html", "")
+
+async def parse_shard_async(filename, shard, file_hash):
+    """Parses one page-range shard, retried on its own; returns None if it keeps failing."""
+    cache_key = parse_cache_key(file_hash, shard_options(PARSE_OPTIONS, shard))
+    cached_html = await asyncio.to_thread(PARSE_CACHE.get, cache_key)
+    if cached_html is not None:
+        return cached_html
+
+    try:
+        html_content = await post_parse_request_async(shard_filename(filename, shard), shard.data)
+    except (httpx.HTTPError, CircuitOpenError) as e:
+        print(f"Error parsing {filename} ({describe_shard(shard)}): {e}")
+        return None
+    if html_content:
+        await asyncio.to_thread(PARSE_CACHE.put, cache_key, html_content)
+    return html_content
+
+@traced("parse_single_pdf")
+async def parse_single_pdf_async(pdf_path, upload_number):
+    """
+    Parses a single PDF (file path or StoredUpload) using Upstage's document
+    parser API. Large PDFs are split into page-range shards parsed concurrently.
+    """
+    filename, pdf_bytes, file_hash = await asyncio.to_thread(read_pdf, pdf_path)
+    current_span().add_payload(len(pdf_bytes))
+    cache_key = parse_cache_key(file_hash, PARSE_OPTIONS)
+    cached_html = await asyncio.to_thread(PARSE_CACHE.get, cache_key)
+    if cached_html is not None:
+        return {
+            "upload_number": upload_number,
+            "context": cached_html,
+            "doc_hash": file_hash
+        }
+
+    shards = await asyncio.to_thread(split_pdf, pdf_bytes)
+    # Per-document cap on top of the process-wide parse_semaphore, so one huge
+    # deck cannot take every parse slot from other requests.
+    shard_semaphore = asyncio.Semaphore(MAX_CONCURRENT_SHARDS)
+
+    async def run_shard(shard):
+        async with shard_semaphore:
+            return await parse_shard_async(filename, shard, file_hash)
+
+    html_parts = await asyncio.gather(*(run_shard(shard) for shard in shards))
+
+    failed = [describe_shard(shard) for shard, html in zip(shards, html_parts) if html is None]
+    html_content = stitch_shards(html_parts)
+    if failed:
+        current_span().fail()
+        print(f"Error parsing PDF #{upload_number}: failed {', '.join(failed)}")
+    elif len(shards) > 1 and html_content:
+        await asyncio.to_thread(PARSE_CACHE.put, cache_key, html_content)
+    return {
+        "upload_number": upload_number,
+        "context": html_content,
+        "doc_hash": file_hash
+    }
+
+@traced("parse_multiple_pdfs")
+async def parse_multiple_pdfs_async(pdf_paths):
+    """
+    Parses multiple PDFs (file paths or StoredUploads) concurrently and returns
+    structured results. Uploads with identical content are parsed once.
+    """
+    parses = {}
+    keys = []
+    for idx, document in enumerate(pdf_paths, start=1):
+        key = getattr(document, "sha256", None) or document
+        if key not in parses:
+            parses[key] = asyncio.ensure_future(parse_single_pdf_async(document, upload_number=idx))
+        keys.append(key)
+
+    await asyncio.gather(*parses.values())
+    parsed_results = [
+        dict(parses[key].result(), upload_number=idx)
+        for idx, key in enumerate(keys, start=1)
+    ]
+
+    print("All PDFs parsed successfully.")
+    return parsed_results
+
+@traced("summarize_with_solar_batch")
+async def summarize_with_solar_batch_async(texts, detail_level="medium"):
+    """Summarize multiple slides in a batch using Solar AI."""
+    prompt = build_summary_prompt(texts, detail_level)
+    current_span().add_payload(len(prompt.encode("utf-8")))
+
+    try:
+        async with llm_semaphore:
+            response = await async_client.chat.completions.create(
+                model="solar-pro",
+                messages=[{"role": "user", "content": prompt}],
+                stream=False
+            )
+        current_span().add_usage(response.usage)
+        return response.choices[0].message.content.strip()
+    except Exception as e:
+        current_span().fail()
+        return f"[Error summarizing: {str(e)}]"
+
+async def summarize_batch_cached_async(texts, detail_level="medium"):
+    """Summarizes a batch, reusing the stored summary if the slides are unchanged."""
+    key = summary_cache_key(texts, detail_level)
+    summary = await asyncio.to_thread(SUMMARY_CACHE.get, key)
+    if summary is not None:
+        return summary
+
+    summary = await summarize_with_solar_batch_async(texts, detail_level)
+    if not is_summary_error(summary):
+        await asyncio.to_thread(SUMMARY_CACHE.put, key, summary)
+    return summary
+
+async def summarize_html_slides_batch_async(html_data: str, detail_level="medium", upload_number=1, token_budget=SUMMARY_TOKEN_BUDGET):
+    """Summarize HTML slide content using Solar AI, batches in parallel."""
+    # HTML parsing is CPU-bound, keep it off the event loop.
+    batches = await asyncio.to_thread(batch_slide_texts, html_data, token_budget)
+    summaries = await asyncio.gather(*(
+        summarize_batch_cached_async(batch, detail_level) for batch in batches
+    ))
+    return build_summary_output(list(summaries), upload_number)
+
+@traced("summarize_from_json_input")
+async def summarize_from_json_input_async(json_input: list, detail_level="medium"):
+    results = await asyncio.gather(*(
+        summarize_html_slides_batch_async(entry["context"], detail_level, entry["upload_number"])
+        for entry in json_input
+    ))
+
+    all_summaries = []
+    for entry, result in zip(json_input, results):
+        all_summaries.extend(tag_summaries(result[0]["summaries"], entry, detail_level))
+
+    print("\nAll documents summarized in parallel.")
+    return {"summaries": all_summaries}
+
+async def request_section_async(prompt):
+    current_span().add_payload(len(prompt.encode("utf-8")))
+    async with llm_semaphore:
+        response = await async_client.chat.completions.create(
+            model="solar-pro",
+            messages=[{"role": "user", "content": prompt}],
+            stream=False,
+        )
+    current_span().add_usage(response.usage)
+    return response.choices[0].message.content.strip()
+
+@traced("generate_section")
+async def generate_section_async(context, count, section_type, start_q_number, retries=SECTION_RETRIES, dedup_index=None):
+    raw_output = await request_section_async(build_section_prompt(context, count, section_type, start_q_number))
+    questions, missing = parse_section_output(raw_output, count, section_type, start_q_number)
+    salvaged = bool(questions)
+
+    # Near-duplicates of questions generated elsewhere are regenerated like gaps.
+    dropped = drop_duplicates(questions, dedup_index)
+    missing = freed_numbers(missing, dropped)
+
+    # Re-request only the question_numbers that could not be salvaged.
+    for _ in range(retries):
+        if not missing:
+            break
+        followup_output = await request_section_async(build_followup_prompt(context, section_type, missing, questions + dropped))
+        extra, _ = parse_section_output(followup_output, len(missing), section_type, missing[0])
+        salvaged = salvaged or bool(extra)
+        dropped += drop_duplicates(extra, dedup_index)
+        missing = merge_followup(questions, extra, missing)
+
+    if not salvaged:
+        raise section_error(raw_output)
+    return questions
+
+async def generate_banked_section_async(task, dedup_index=None, bank=QUESTION_BANK):
+    """Async counterpart of generate_banked_section()."""
+    if bank is None or not task.get("doc_hash"):
+        return await generate_section_async(task["context"], task["count"], task["section_type"], task["start_q_number"],
+                                            dedup_index=dedup_index)
+
+    key = (task["doc_hash"], task["section_type"], task["detail_level"])
+    questions = await asyncio.to_thread(bank.draw, *key, task["count"])
+    if dedup_index is not None:
+        for question in questions:
+            dedup_index.add(question["context"])
+
+    shortfall = task["count"] - len(questions)
+    if shortfall > 0:
+        try:
+            fresh = await generate_section_async(task["context"], shortfall + QUESTION_BANK_SURPLUS, task["section_type"],
+                                                 task["start_q_number"] + len(questions), dedup_index=dedup_index)
+        except BaseException:
+            # Called directly, not in a thread, so it also runs when the task is cancelled.
+            bank.release(*key, questions)
+            raise
+        await asyncio.to_thread(bank.store, *key, fresh[:shortfall], True)
+        await asyncio.to_thread(bank.store, *key, fresh[shortfall:])
+        questions.extend(fresh[:shortfall])
+
+    return questions
+
+@traced("interactive_question_generation")
+async def interactive_question_generation_async(summaries_json, question_settings, max_concurrency=MAX_CONCURRENT_SECTIONS,
+                                                dedup_index=None, bank=QUESTION_BANK):
+    """Async counterpart of interactive_question_generation()."""
+    tasks = plan_section_tasks(summaries_json, question_settings)
+    semaphore = asyncio.Semaphore(max_concurrency)
+    if dedup_index is None:
+        dedup_index = NearDuplicateIndex()
+
+    async def run_task(task):
+        async with semaphore:
+            try:
+                return await generate_banked_section_async(task, dedup_index=dedup_index, bank=bank)
+            except Exception as e:
+                return e
+
+    results = await asyncio.gather(*(run_task(task) for task in tasks))
+    return assemble_exam(summaries_json, tasks, results)
+
+async def get_exam_questions_async(pdfs, question_settings, detail_level="medium"):
+    parsed = await parse_multiple_pdfs_async(pdfs)
+
+    summarized = await summarize_from_json_input_async(parsed, detail_level=detail_level)
+
+    return await interactive_question_generation_async(summarized, question_settings)
+
+async def stream_exam_generation(pdf_paths, question_settings, detail_level="medium",
+                                 max_concurrency=MAX_CONCURRENT_SECTIONS, heartbeat_interval=15, dedup_index=None,
+                                 bank=QUESTION_BANK):
+    """
+    Runs the pipeline per upload and yields events as soon as each stage finishes:
+        {"event": "parsed", "upload_number", "characters"}
+        {"event": "summarized", "upload_number", "context"}
+        {"event": "section", "upload_number", "section_type", "questions" | "error"}
+        {"event": "heartbeat"}  while nothing finished for heartbeat_interval seconds
+        {"event": "complete", "question_data"}  same payload as /generate_exam/
+    An upload's sections start as soon as its own summary is ready.
+    """
+    queue = asyncio.Queue()
+    semaphore = asyncio.Semaphore(max_concurrency)
+    if dedup_index is None:
+        dedup_index = NearDuplicateIndex()
+    summaries = {}
+    section_results = {}
+
+    async def run_task(task):
+        async with semaphore:
+            try:
+                result = await generate_banked_section_async(task, dedup_index=dedup_index, bank=bank)
+            except Exception as e:
+                result = e
+
+        event = {
+            "event": "section",
+            "upload_number": task["upload_number"],
+            "section_type": task["section_type"]
+        }
+        if isinstance(result, Exception):
+            event["error"] = str(result)
+        else:
+            # Copies, so the final renumbering cannot alter events not yet sent.
+            event["questions"] = [dict(q) if isinstance(q, dict) else q for q in result]
+        await queue.put(event)
+        return result
+
+    async def run_upload(upload_number, pdf_path):
+        parsed = await parse_single_pdf_async(pdf_path, upload_number)
+        await queue.put({"event": "parsed", "upload_number": upload_number, "characters": len(parsed["context"])})
+
+        json_output, _ = await summarize_html_slides_batch_async(parsed["context"], detail_level, upload_number)
+        item = tag_summaries(json_output["summaries"], parsed, detail_level)[0]
+        summaries[upload_number] = item
+        await queue.put({"event": "summarized", "upload_number": upload_number, "context": item["context"]})
+
+        tasks = plan_section_tasks({"summaries": [item]}, question_settings)
+        results = await asyncio.gather(*(run_task(task) for task in tasks))
+        section_results[upload_number] = (tasks, list(results))
+
+    async def run_all():
+        try:
+            await asyncio.gather(*(
+                run_upload(idx, path) for idx, path in enumerate(pdf_paths, start=1)
+            ))
+        finally:
+            await queue.put(None)
+
+    runner = asyncio.create_task(run_all())
+    try:
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), timeout=heartbeat_interval)
+            except asyncio.TimeoutError:
+                yield {"event": "heartbeat"}
+                continue
+            if event is None:
+                break
+            yield event
+        await runner
+    finally:
+        if not runner.done():
+            runner.cancel()
+
+    upload_numbers = sorted(summaries)
+    all_tasks, all_results = [], []
+    for upload_number in upload_numbers:
+        tasks, results = section_results[upload_number]
+        all_tasks.extend(tasks)
+        all_results.extend(results)
+
+    summaries_json = {"summaries": [summaries[n] for n in upload_numbers]}
+    yield {"event": "complete", "question_data": assemble_exam(summaries_json, all_tasks, all_results)}
@@ -0,0 +1,124 @@
+import re
+import hashlib
+import threading
+from array import array
+
+# ---- Near-duplicate detection for generated questions ---- #
+# MinHash signatures over word-bigram shingles of the question text, bucketed
+# with LSH banding so a lookup only compares against the handful of stored
+# questions that share a band, not the whole bank.
+
+_WORD_PATTERN = re.compile(r"\w+")
+
+
+def shingles(text, size=2):
+    """Returns the set of word n-grams of normalized text."""
+    words = _WORD_PATTERN.findall(text.lower())
+    if len(words) < size:
+        return set(words)
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+class NearDuplicateIndex:
+    """
+    MinHash/LSH index of question texts.
+    With the defaults (64 permutations, 16 bands of 4 rows, at least 2 shared
+    bands) a pair with Jaccard similarity 0.7 becomes a candidate ~93% of the
+    time, 0.8 ~99.8%, and a candidate counts as a duplicate when its
+    estimated similarity is at least threshold.
+    """
+
+    def __init__(self, num_perm=64, bands=16, threshold=0.7, min_shared_bands=2,
+                 max_bucket_size=256, seed=1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.threshold = threshold
+        self.min_shared_bands = min_shared_bands
+        self.max_bucket_size = max_bucket_size
+        self._seed = f"{seed}:".encode("utf-8")
+        self._signatures = []  # compact uint32 arrays, indexed by entry id
+        self._payloads = []
+        self._buckets = {}  # (band, band hash) -> [entry ids]
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._signatures)
+
+    def signature(self, text):
+        grams = shingles(text)
+        if not grams:
+            return None
+        # One SHAKE-128 digest gives num_perm independent 32-bit hashes of a
+        # shingle, so the per-permutation minimum runs in C, not a Python loop.
+        width = 4 * self.num_perm
+        vectors = [
+            array("I", hashlib.shake_128(self._seed + gram.encode("utf-8")).digest(width))
+            for gram in grams
+        ]
+        return array("I", map(min, zip(*vectors)))
+
+    def _band_keys(self, signature):
+        rows = self.rows
+        return [(band, hash(tuple(signature[band * rows:(band + 1) * rows])))
+                for band in range(self.bands)]
+
+    def _find(self, signature, band_keys):
+        # Count shared bands per stored entry; only entries sharing at least
+        # min_shared_bands bands get the full comparison. Bands made of very
+        # common phrasing ("which of the following") fill huge buckets that
+        # say nothing about similarity, so those are skipped like stopwords.
+        shared = {}
+        for key in band_keys:
+            bucket = self._buckets.get(key, ())
+            if len(bucket) > self.max_bucket_size:
+                continue
+            for entry_id in bucket:
+                shared[entry_id] = shared.get(entry_id, 0) + 1
+
+        needed = self.threshold * self.num_perm
+        for entry_id, count in shared.items():
+            if count < self.min_shared_bands:
+                continue
+            stored = self._signatures[entry_id]
+            if sum(map(int.__eq__, signature, stored)) >= needed:
+                return entry_id
+        return None
+
+    def query(self, text):
+        """Returns the payload (by default the text) of a stored near-duplicate, or None."""
+        signature = self.signature(text)
+        if signature is None:
+            return None
+        with self._lock:
+            entry_id = self._find(signature, self._band_keys(signature))
+            return None if entry_id is None else self._payloads[entry_id]
+
+    def add(self, text, payload=None):
+        """Stores text unconditionally."""
+        signature = self.signature(text)
+        if signature is None:
+            return
+        with self._lock:
+            self._insert(signature, self._band_keys(signature), text if payload is None else payload)
+
+    def add_if_new(self, text, payload=None):
+        """Stores text unless a near-duplicate exists; returns True if it was stored."""
+        signature = self.signature(text)
+        if signature is None:
+            return True
+        band_keys = self._band_keys(signature)
+        with self._lock:
+            if self._find(signature, band_keys) is not None:
+                return False
+            self._insert(signature, band_keys, text if payload is None else payload)
+            return True
+
+    def _insert(self, signature, band_keys, payload):
+        entry_id = len(self._signatures)
+        self._signatures.append(signature)
+        self._payloads.append(payload)
+        for key in band_keys:
+            self._buckets.setdefault(key, []).append(entry_id)
@@ -1,48 +1,119 @@
 
 import os
 import requests
-from openai import OpenAI
 from concurrent.futures import ThreadPoolExecutor
 import re
 from bs4 import BeautifulSoup
-import json
-
-client = OpenAI(
-    api_key=os.getenv("UPSTAGE_API_KEY"),
-    base_url="https://api.upstage.ai/v1"
+import hashlib
+import math
+from html.parser import HTMLParser
+from question_parser import salvage_section, merge_followup, question_number_of
+from dedup_index import NearDuplicateIndex
+from question_bank import QUESTION_BANK, QUESTION_BANK_SURPLUS
+from uploads import load_document
+from transport import UPSTAGE_BASE_URL, openai_client, post_with_retry
+from metrics import traced, current_span
+from pdf_shards import (
+    split_pdf,
+    shard_filename,
+    shard_options,
+    stitch_shards,
+    describe_shard,
+    MAX_CONCURRENT_SHARDS,
+    PARSE_SHARD_RETRIES,
 )
+from disk_cache import DiskCache, PARSE_CACHE, file_digest, parse_cache_key
 
-def parse_single_pdf(pdf_path, upload_number):
-    """Parses a single PDF file using Upstage's document parser API."""
-    if not os.path.exists(pdf_path):
-        raise FileNotFoundError(f"File not found: {pdf_path}")
+PARSE_URL = f"{UPSTAGE_BASE_URL}/document-digitization"
+PARSE_TIMEOUT = float(os.getenv("PARSE_TIMEOUT", "300"))
+
+client = openai_client()
+
+SUMMARY_CACHE = DiskCache(
+    os.getenv("SUMMARY_CACHE_DIR", "/tmp/summary_cache"),
+    max_bytes=int(os.getenv("SUMMARY_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+)
 
-    url = "https://api.upstage.ai/v1/document-digitization"
+# Summary prompts are packed up to this many estimated tokens of slide text.
+SUMMARY_TOKEN_BUDGET = int(os.getenv("SUMMARY_TOKEN_BUDGET", "4000"))
+MIN_SLIDE_TOKENS = int(os.getenv("MIN_SLIDE_TOKENS", "40"))
+_TOKEN_PATTERN = re.compile(r"[A-Za-z]+|\d+|\S")
+
+PARSE_OPTIONS = {
+    "ocr": "force",
+    "base64_encoding": "['table']",
+    "model": "document-parse"
+}
+
+def read_pdf(document):
+    """Returns (filename, bytes, sha256) for a PDF path or a StoredUpload."""
+    if isinstance(document, str) and not os.path.exists(document):
+        raise FileNotFoundError(f"File not found: {document}")
+    filename, pdf_bytes, file_hash = load_document(document)
+    return filename, pdf_bytes, file_hash or file_digest(pdf_bytes)
+
+def post_parse_request(filename, pdf_bytes, options=PARSE_OPTIONS, retries=PARSE_SHARD_RETRIES):
+    """Sends one PDF to the document parser and returns its HTML."""
     headers = {"Authorization": f"Bearer {client.api_key}"}
+    files = {"document": (filename, pdf_bytes)}
+    response = post_with_retry(PARSE_URL, retries=retries, timeout=PARSE_TIMEOUT,
+                               headers=headers, files=files, data=options)
+    return response.json().get("content", {}).get("html", "")
+
+def parse_shard(filename, shard, file_hash):
+    """Parses one page-range shard, retried on its own; returns None if it keeps failing."""
+    cache_key = parse_cache_key(file_hash, shard_options(PARSE_OPTIONS, shard))
+    cached_html = PARSE_CACHE.get(cache_key)
+    if cached_html is not None:
+        return cached_html
 
-    with open(pdf_path, "rb") as file:
-        files = {"document": file}
-        data = {
-            "ocr": "force",
-            "base64_encoding": "['table']",
-            "model": "document-parse"
+    try:
+        html_content = post_parse_request(shard_filename(filename, shard), shard.data)
+    except requests.RequestException as e:
+        print(f"Error parsing {filename} ({describe_shard(shard)}): {e}")
+        return None
+    if html_content:
+        PARSE_CACHE.put(cache_key, html_content)
+    return html_content
+
+@traced("parse_single_pdf")
+def parse_single_pdf(pdf_path, upload_number):
+    """
+    Parses a single PDF (file path or StoredUpload) using Upstage's document
+    parser API. Large PDFs are split into page-range shards parsed concurrently.
+    """
+    filename, pdf_bytes, file_hash = read_pdf(pdf_path)
+    current_span().add_payload(len(pdf_bytes))
+
+    # Identical bytes parsed with identical options always give the same HTML.
+    cache_key = parse_cache_key(file_hash, PARSE_OPTIONS)
+    cached_html = PARSE_CACHE.get(cache_key)
+    if cached_html is not None:
+        return {
+            "upload_number": upload_number,
+            "context": cached_html,
+            "doc_hash": file_hash
         }
 
-        try:
-            response = requests.post(url, headers=headers, files=files, data=data)
-            response.raise_for_status()
-            html_content = response.json().get("content", {}).get("html", "")
-            return {
-                "upload_number": upload_number,
-                "context": html_content
-            }
-        except requests.RequestException as e:
-            print(f"Error parsing PDF #{upload_number}: {e}")
-            return {
-                "upload_number": upload_number,
-                "context": ""
-            }
+    shards = split_pdf(pdf_bytes)
+    with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_SHARDS) as executor:
+        html_parts = list(executor.map(lambda shard: parse_shard(filename, shard, file_hash), shards))
+
+    failed = [describe_shard(shard) for shard, html in zip(shards, html_parts) if html is None]
+    html_content = stitch_shards(html_parts)
+    if failed:
+        current_span().fail()
+        print(f"Error parsing PDF #{upload_number}: failed {', '.join(failed)}")
+    elif len(shards) > 1 and html_content:
+        # Single-shard results were already cached under the document key.
+        PARSE_CACHE.put(cache_key, html_content)
+    return {
+        "upload_number": upload_number,
+        "context": html_content,
+        "doc_hash": file_hash
+    }
 
+@traced("parse_multiple_pdfs")
 def parse_multiple_pdfs(pdf_paths):
     """Parses multiple PDF files in parallel and returns structured results."""
     base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -73,13 +144,89 @@ def preprocess_slides(html_input):
     slides = [slide.strip() + "</footer>" for slide in slides if slide.strip()]
     return slides
 
+_DISALLOWED_CHARS = re.compile(r'[^\x00-\x7F\uAC00-\uD7AF\u3130-\u318F\u1100-\u11FF]+')
+_WHITESPACE = re.compile(r'\s+')
+
 def clean_text(text):
     """Cleans the extracted text to remove unnecessary characters."""
-    text = re.sub(r'[^\x00-\x7F\uAC00-\uD7AF\u3130-\u318F\u1100-\u11FF]+', ' ', text)
-    return re.sub(r'\s+', ' ', text).strip()
-
-def summarize_with_solar_batch(texts, detail_level="medium"):
-    """Summarize multiple slides in a batch using Solar AI."""
+    text = _DISALLOWED_CHARS.sub(' ', text)
+    return _WHITESPACE.sub(' ', text).strip()
+
+class _SlideTextParser(HTMLParser):
+    """Collects visible text, closing a slide at every </footer>."""
+
+    # BeautifulSoup's get_text() leaves out the contents of these tags too.
+    SKIPPED_TAGS = {"script", "style", "template"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.finished = []
+        self._parts = []
+        self._text = []  # pieces of the current text node
+        self._skip_depth = 0
+
+    def flush_text(self):
+        # A text node arrives in several handle_data() calls when it spans
+        # feed() chunks; strip it only once it is complete, as get_text() does.
+        data = "".join(self._text).strip()
+        self._text = []
+        if data:
+            self._parts.append(data)
+
+    def handle_starttag(self, tag, attrs):
+        self.flush_text()
+        if tag in self.SKIPPED_TAGS:
+            self._skip_depth += 1
+
+    def handle_endtag(self, tag):
+        self.flush_text()
+        if tag in self.SKIPPED_TAGS:
+            self._skip_depth = max(0, self._skip_depth - 1)
+        elif tag == "footer":
+            self.end_slide()
+
+    def handle_comment(self, data):
+        self.flush_text()
+
+    def handle_decl(self, decl):
+        self.flush_text()
+
+    def handle_pi(self, data):
+        self.flush_text()
+
+    def handle_data(self, data):
+        if not self._skip_depth:
+            self._text.append(data)
+
+    def end_slide(self):
+        self.flush_text()
+        self.finished.append(clean_text(" ".join(self._parts)))
+        self._parts = []
+
+    def has_pending_text(self):
+        self.flush_text()
+        return bool(self._parts)
+
+def iter_slide_texts(html_input, chunk_size=64 * 1024):
+    """
+    Yields the cleaned text of each slide in one pass over the HTML.
+    Equivalent to clean_text(extract_text_from_html(slide)) for every slide of
+    preprocess_slides(html_input), without building a soup per slide; a
+    trailing fragment after the last </footer> is yielded only if it has text.
+    """
+    parser = _SlideTextParser()
+    for start in range(0, len(html_input), chunk_size):
+        parser.feed(html_input[start:start + chunk_size])
+        yield from parser.finished
+        parser.finished.clear()
+
+    parser.close()
+    if parser.has_pending_text():
+        parser.end_slide()
+    yield from parser.finished
+
+def build_summary_prompt(texts, detail_level="medium"):
+    """Builds the Solar prompt for summarizing a batch of slide texts."""
     level_instruction = {
         "short": "Summarize briefly in 100 word.",
         "medium": "Summarize the content clearly and concisely in 100-250 words.",
@@ -90,6 +237,13 @@ def summarize_with_solar_batch(texts, detail_level="medium"):
     prompt = f"{instruction}\n\nContent:\n\"\"\"\n"
     prompt += "\n\n".join(texts)
     prompt += "\n\"\"\"\n\nSummary:"
+    return prompt
+
+@traced("summarize_with_solar_batch")
+def summarize_with_solar_batch(texts, detail_level="medium"):
+    """Summarize multiple slides in a batch using Solar AI."""
+    prompt = build_summary_prompt(texts, detail_level)
+    current_span().add_payload(len(prompt.encode("utf-8")))
 
     try:
         response = client.chat.completions.create(
@@ -97,25 +251,144 @@ def summarize_with_solar_batch(texts, detail_level="medium"):
             messages=[{"role": "user", "content": prompt}],
             stream=False
         )
+        current_span().add_usage(response.usage)
         return response.choices[0].message.content.strip()
     except Exception as e:
+        current_span().fail()
         return f"[Error summarizing: {str(e)}]"
 
-def summarize_html_slides_batch(html_data: str, detail_level="medium", upload_number=1, batch_size=5):
-    """Summarize HTML slide content using Solar AI in batches."""
-    slides = preprocess_slides(html_data)
-    summaries = []
-    batch = []
-
-    for idx, chunk in enumerate(slides, start=1):
-        text = clean_text(extract_text_from_html(chunk))
-        if len(text.strip()) > 20:
-            batch.append(text)
-        if len(batch) >= batch_size or idx == len(slides):
-            batch_summary = summarize_with_solar_batch(batch, detail_level)
-            summaries.append(batch_summary)
-            batch.clear()
+def summary_cache_key(texts, detail_level="medium"):
+    """Hashes a batch of cleaned slide texts together with the detail level."""
+    digest = hashlib.sha256(detail_level.lower().encode("utf-8"))
+    for text in texts:
+        digest.update(b"\x00")
+        digest.update(text.encode("utf-8"))
+    return digest.hexdigest()
+
+def is_summary_error(summary):
+    """Error placeholders from summarize_with_solar_batch() must never be cached."""
+    return summary.startswith("[Error summarizing:")
+
+def summarize_batch_cached(texts, detail_level="medium"):
+    """Summarizes a batch, reusing the stored summary if the slides are unchanged."""
+    key = summary_cache_key(texts, detail_level)
+    summary = SUMMARY_CACHE.get(key)
+    if summary is not None:
+        return summary
+
+    summary = summarize_with_solar_batch(texts, detail_level)
+    if not is_summary_error(summary):
+        SUMMARY_CACHE.put(key, summary)
+    return summary
+
+def invalidate_summaries(html_data: str, detail_levels=("short", "medium", "detailed"), token_budget=SUMMARY_TOKEN_BUDGET):
+    """Drops every cached batch summary of a parsed document; returns the number removed."""
+    removed = 0
+    for batch in batch_slide_texts(html_data, token_budget):
+        for detail_level in detail_levels:
+            if SUMMARY_CACHE.delete(summary_cache_key(batch, detail_level)):
+                removed += 1
+    return removed
+
+def estimate_tokens(text):
+    """Cheap local estimate of the LLM token count of text."""
+    # Roughly one token per 4 letters of a word or 3 digits of a number;
+    # punctuation and Hangul syllables count one each.
+    tokens = 0
+    for piece in _TOKEN_PATTERN.findall(text):
+        if piece[0].isascii() and piece[0].isalpha():
+            tokens += math.ceil(len(piece) / 4)
+        elif piece[0].isdigit():
+            tokens += math.ceil(len(piece) / 3)
+        else:
+            tokens += 1
+    return tokens
+
+def split_to_budget(text, token_budget):
+    """Splits text on word boundaries into pieces of at most token_budget tokens."""
+    pieces = []
+    words = []
+    used = 0
+    for word in text.split(" "):
+        cost = estimate_tokens(word)
+        if words and used + cost > token_budget:
+            pieces.append(" ".join(words))
+            words = []
+            used = 0
+        words.append(word)
+        used += cost
+    if words:
+        pieces.append(" ".join(words))
+    return pieces
+
+def slide_texts(html_data: str):
+    """Lazily yields the cleaned text of every slide worth summarizing."""
+    for text in iter_slide_texts(html_data):
+        if len(text) > 20:
+            yield text
+
+def is_batch_boundary(segment, cost, target_tokens):
+    """
+    True if a batch should end after this segment. Decided by the segment's
+    own hash, with probability cost / target_tokens, so batches average about
+    target_tokens and a boundary never depends on the slides before it.
+    """
+    digest = int.from_bytes(hashlib.sha256(segment.encode("utf-8")).digest()[:8], "big")
+    return digest < min(1.0, cost / target_tokens) * 2 ** 64
 
+def pack_slide_texts(texts, token_budget=SUMMARY_TOKEN_BUDGET, min_slide_tokens=MIN_SLIDE_TOKENS):
+    """
+    Groups slide texts into summary batches with content-defined boundaries.
+    Once a batch holds half of token_budget, it ends after any slide whose
+    hash selects it (see is_batch_boundary, aiming at the full budget), and
+    any batch ends early if the next slide would push it past token_budget.
+    Boundaries follow slide content, not position, so editing one slide
+    changes the cache key of only a few nearby batches instead of every
+    later batch, as greedy filling to the budget did. Batches average about
+    three quarters of the budget, so decks take fewer calls than fixed
+    5-slide batches (see benchmarks/summary_batching_report.py). Slides
+    under min_slide_tokens (title-only slides) are merged into the slide
+    that follows them, and a slide larger than the budget is split so no
+    prompt exceeds it.
+    """
+    segments = []
+    pending = ""
+    for text in texts:
+        text = f"{pending} {text}" if pending else text
+        if estimate_tokens(text) < min_slide_tokens:
+            pending = text
+            continue
+        pending = ""
+        segments.extend(split_to_budget(text, token_budget))
+    if pending:
+        segments.append(pending)
+
+    target_tokens, min_batch_tokens = max(1, token_budget), token_budget // 2
+    batches = []
+    batch = []
+    used = 0
+    for segment in segments:
+        cost = estimate_tokens(segment) + 1  # +1 for the blank-line separator
+        if batch and used + cost > token_budget:
+            batches.append(batch)
+            batch = []
+            used = 0
+        batch.append(segment)
+        used += cost
+        if used >= min_batch_tokens and is_batch_boundary(segment, cost, target_tokens):
+            batches.append(batch)
+            batch = []
+            used = 0
+    if batch:
+        batches.append(batch)
+    return batches
+
+def batch_slide_texts(html_data: str, token_budget=SUMMARY_TOKEN_BUDGET):
+    """Splits parsed HTML into token-budgeted batches of cleaned slide texts."""
+    return pack_slide_texts(slide_texts(html_data), token_budget)
+
+def build_summary_output(summaries, upload_number):
+    """Combines batch summaries into the per-upload summary structure."""
     combined_summary = " ".join(summaries)
 
     json_output = {
@@ -129,14 +402,31 @@ def summarize_html_slides_batch(html_data: str, detail_level="medium", upload_nu
 
     return json_output, combined_summary
 
+def summarize_html_slides_batch(html_data: str, detail_level="medium", upload_number=1, token_budget=SUMMARY_TOKEN_BUDGET):
+    """Summarize HTML slide content using Solar AI in batches."""
+    # Only batches whose slide text changed since the last run go back to Solar.
+    summaries = [
+        summarize_batch_cached(batch, detail_level)
+        for batch in batch_slide_texts(html_data, token_budget)
+    ]
+    return build_summary_output(summaries, upload_number)
+
+def tag_summaries(summaries, parsed_entry, detail_level):
+    """Carries the source document hash and detail level into summary entries."""
+    for summary in summaries:
+        summary["doc_hash"] = parsed_entry.get("doc_hash")
+        summary["detail_level"] = detail_level
+    return summaries
+
+@traced("summarize_from_json_input")
 def summarize_from_json_input(json_input: list, detail_level="medium"):
     all_summaries = []
 
     with ThreadPoolExecutor() as executor:
         results = executor.map(lambda entry: summarize_html_slides_batch(entry["context"], detail_level, entry["upload_number"]), json_input)
 
-    for result in results:
-        all_summaries.extend(result[0]["summaries"])
+    for entry, result in zip(json_input, results):
+        all_summaries.extend(tag_summaries(result[0]["summaries"], entry, detail_level))
 
     print("\nAll documents summarized in parallel.")
     return {"summaries": all_summaries}
@@ -147,8 +437,9 @@ def clean_json_response(text):
     text = re.sub(r"```$", "", text)
     return text.strip()
 
-def generate_section(context, count, section_type, start_q_number):
-    base_prompt = f'''
+def build_section_prompt(context, count, section_type, start_q_number):
+    """Builds the prompt asking Solar for one section of exam questions."""
+    return f'''
 You are an exam question generator. Based on the context below, generate {count} {section_type} exam questions.
 
 Context:
@@ -191,68 +482,182 @@ Example format for True/False, Short Answer, Essay (no choices field):
 Only return the JSON array. No explanations or additional text.
 '''
 
+SECTION_RETRIES = int(os.getenv("SECTION_RETRIES", "1"))
+
+def build_followup_prompt(context, section_type, missing_numbers, existing_questions):
+    """Asks only for the questions that were missing or invalid in the first response."""
+    prompt = build_section_prompt(context, len(missing_numbers), section_type, missing_numbers[0])
+    if existing_questions:
+        prompt += "\nDo not repeat any of these existing questions:\n"
+        prompt += "\n".join(f"- {q['context']}" for q in existing_questions)
+        prompt += "\n"
+    return prompt
+
+def parse_section_output(raw_output, count, section_type, start_q_number):
+    """
+    Parses the JSON array of questions returned for a section, keeping every
+    well-formed question even if the array as a whole is malformed.
+    Returns (questions, missing_numbers).
+    """
+    return salvage_section(clean_json_response(raw_output), count, section_type, start_q_number)
+
+def section_error(raw_output):
+    return ValueError(f"Invalid JSON output: no valid questions\n\nReturned content:\n{raw_output}")
+
+def request_section(prompt):
+    """One Solar call; its prompt size and tokens count towards the enclosing generate_section span."""
+    current_span().add_payload(len(prompt.encode("utf-8")))
     response = client.chat.completions.create(
         model="solar-pro",
-        messages=[{"role": "user", "content": base_prompt}],
+        messages=[{"role": "user", "content": prompt}],
         stream=False,
     )
+    current_span().add_usage(response.usage)
+    return response.choices[0].message.content.strip()
+
+def drop_duplicates(questions, dedup_index):
+    """
+    Removes questions that near-duplicate one already in dedup_index and
+    registers the rest. Returns the removed questions.
+    """
+    if dedup_index is None:
+        return []
+    kept, dropped = [], []
+    for question in questions:
+        if dedup_index.add_if_new(question["context"]):
+            kept.append(question)
+        else:
+            dropped.append(question)
+    questions[:] = kept
+    return dropped
+
+def freed_numbers(missing, dropped):
+    """Adds the question_numbers of dropped questions back to the missing slots."""
+    numbers = [question_number_of(q) for q in dropped]
+    return sorted(set(missing) | {n for n in numbers if n is not None})
+
+@traced("generate_section")
+def generate_section(context, count, section_type, start_q_number, retries=SECTION_RETRIES, dedup_index=None):
+    raw_output = request_section(build_section_prompt(context, count, section_type, start_q_number))
+    questions, missing = parse_section_output(raw_output, count, section_type, start_q_number)
+    salvaged = bool(questions)
+
+    # Near-duplicates of questions generated elsewhere are regenerated like gaps.
+    dropped = drop_duplicates(questions, dedup_index)
+    missing = freed_numbers(missing, dropped)
+
+    # Re-request only the question_numbers that could not be salvaged.
+    for _ in range(retries):
+        if not missing:
+            break
+        followup_output = request_section(build_followup_prompt(context, section_type, missing, questions + dropped))
+        extra, _ = parse_section_output(followup_output, len(missing), section_type, missing[0])
+        salvaged = salvaged or bool(extra)
+        dropped += drop_duplicates(extra, dedup_index)
+        missing = merge_followup(questions, extra, missing)
+
+    if not salvaged:
+        raise section_error(raw_output)
+    return questions
+
+def generate_banked_section(task, dedup_index=None, bank=QUESTION_BANK):
+    """
+    Fills a planned section from unused bank questions for the same document,
+    section type and detail level, and generates only the shortfall (plus a
+    few surplus questions left unused in the bank for later exams).
+    """
+    if bank is None or not task.get("doc_hash"):
+        return generate_section(task["context"], task["count"], task["section_type"], task["start_q_number"],
+                                dedup_index=dedup_index)
+
+    key = (task["doc_hash"], task["section_type"], task["detail_level"])
+    questions = bank.draw(*key, task["count"])
+    if dedup_index is not None:
+        for question in questions:
+            dedup_index.add(question["context"])
+
+    shortfall = task["count"] - len(questions)
+    if shortfall > 0:
+        try:
+            fresh = generate_section(task["context"], shortfall + QUESTION_BANK_SURPLUS, task["section_type"],
+                                     task["start_q_number"] + len(questions), dedup_index=dedup_index)
+        except BaseException:
+            # The section fails as a whole; drawn questions stay in the bank for the next exam.
+            bank.release(*key, questions)
+            raise
+        bank.store(*key, fresh[:shortfall], used=True)
+        bank.store(*key, fresh[shortfall:])
+        questions.extend(fresh[:shortfall])
+
+    return questions
+
+# Section order within an upload; question numbering follows this order.
+SECTION_TYPES = [
+    ("mcq", "Multiple Choice"),
+    ("tf", "True/False"),
+    ("sa", "Short Answer"),
+    ("num", "Numerical"),
+]
 
-    raw_output = response.choices[0].message.content.strip()
-    clean_output = clean_json_response(raw_output)
+MAX_CONCURRENT_SECTIONS = int(os.getenv("MAX_CONCURRENT_SECTIONS", "8"))
 
-    try:
-        questions = json.loads(clean_output)
-        return questions
-    except Exception as e:
-        raise ValueError(f"Invalid JSON output: {e}\n\nReturned content:\n{raw_output}")
+def plan_section_tasks(summaries_json, question_settings):
+    """Lists the (upload, section) generation tasks in exam order."""
+    tasks = []
 
-def interactive_question_generation(summaries_json, question_settings):
+    for item in summaries_json.get("summaries", []):
+        settings = question_settings.get(item["upload_number"], {"mcq": 0, "tf": 0, "sa": 0, "num": 0})
+        start_q_number = 1
+
+        for key, section_type in SECTION_TYPES:
+            count = settings.get(key, 0)
+            if count > 0:
+                tasks.append({
+                    "upload_number": item["upload_number"],
+                    "context": item["context"],
+                    "section_type": section_type,
+                    "count": count,
+                    "start_q_number": start_q_number,
+                    "doc_hash": item.get("doc_hash"),
+                    "detail_level": item.get("detail_level", "medium")
+                })
+                start_q_number += count
+
+    return tasks
+
+def assemble_exam(summaries_json, tasks, results):
     """
-    summaries_json: Output of summarize_from_json_input()
-    question_settings: A dict mapping upload_number to question counts, e.g.
-        {
-            1: {"mcq": 3, "tf": 2, "sa": 1, "num": 1},
-            2: {"mcq": 2, "tf": 2, "sa": 2, "num": 0}
-        }
+    Builds the exam output from finished tasks.
+    results[i] is the question list for tasks[i], or the exception it raised.
+    A section that came back with fewer questions than planned gets an error
+    entry after its questions, so the shortfall shows in the exam.
+    A failed section is reported in place and the upload's later sections are
+    kept, since their bank questions are already marked used. Questions are
+    numbered by position so the output does not depend on completion order.
     """
+    results_by_upload = {}
+    for task, result in zip(tasks, results):
+        results_by_upload.setdefault(task["upload_number"], []).append((task, result))
+
     output_data = {"exam": []}
 
     for item in summaries_json.get("summaries", []):
         upload_num = item["upload_number"]
-        context = item["context"]
-
-        settings = question_settings.get(upload_num, {"mcq": 0, "tf": 0, "sa": 0, "num": 0})
-        mcq = settings.get("mcq", 0)
-        tf = settings.get("tf", 0)
-        sa = settings.get("sa", 0)
-        num = settings.get("num", 0)
-
         all_questions = []
-        current_q_num = 1
 
-        try:
-            if mcq > 0:
-                questions = generate_section(context, mcq, "Multiple Choice", current_q_num)
-                all_questions.extend(questions)
-                current_q_num += mcq
-
-            if tf > 0:
-                questions = generate_section(context, tf, "True/False", current_q_num)
-                all_questions.extend(questions)
-                current_q_num += tf
-
-            if sa > 0:
-                questions = generate_section(context, sa, "Short Answer", current_q_num)
-                all_questions.extend(questions)
-                current_q_num += sa
-
-            if num > 0:
-                questions = generate_section(context, num, "Numerical", current_q_num)
-                all_questions.extend(questions)
-                current_q_num += num
+        for task, result in results_by_upload.get(upload_num, []):
+            if isinstance(result, Exception):
+                all_questions.append({"error": str(result)})
+                continue
+            all_questions.extend(result)
+            if len(result) < task["count"]:
+                all_questions.append({
+                    "error": f"Only {len(result)} of {task['count']} {task['section_type']} questions could be generated"
+                })
 
-        except Exception as e:
-            all_questions.append({"error": str(e)})
+        numbered = [q for q in all_questions if isinstance(q, dict) and "error" not in q]
+        for q_num, question in enumerate(numbered, start=1):
+            question["question_number"] = q_num
 
         output_data["exam"].append({
             "upload_number": upload_num,
@@ -261,6 +666,37 @@ def interactive_question_generation(summaries_json, question_settings):
 
     return output_data
 
+@traced("interactive_question_generation")
+def interactive_question_generation(summaries_json, question_settings, max_concurrency=MAX_CONCURRENT_SECTIONS, dedup_index=None,
+                                    bank=QUESTION_BANK):
+    """
+    summaries_json: Output of summarize_from_json_input()
+    question_settings: A dict mapping upload_number to question counts, e.g.
+        {
+            1: {"mcq": 3, "tf": 2, "sa": 1, "num": 1},
+            2: {"mcq": 2, "tf": 2, "sa": 2, "num": 0}
+        }
+    All (upload, section) tasks run concurrently, up to max_concurrency at once.
+    Near-duplicate questions within the exam are checked against dedup_index,
+    a fresh per-exam index unless another is passed in. Unused questions in
+    bank are reused before calling the model, and surplus questions are
+    checked against the bank's own process-wide index before being stored.
+    """
+    tasks = plan_section_tasks(summaries_json, question_settings)
+    if dedup_index is None:
+        dedup_index = NearDuplicateIndex()
+
+    def run_task(task):
+        try:
+            return generate_banked_section(task, dedup_index=dedup_index, bank=bank)
+        except Exception as e:
+            return e
+
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        results = list(executor.map(run_task, tasks))
+
+    return assemble_exam(summaries_json, tasks, results)
+
 def get_exam_questions(pdfs, detail_level="medium"):
     
     parsed = parse_multiple_pdfs(pdfs)
@@ -0,0 +1,230 @@
+import os
+import json
+import time
+import fcntl
+import shutil
+import asyncio
+from uuid import uuid4
+from collections import deque
+from async_generator import (
+    parse_multiple_pdfs_async,
+    summarize_from_json_input_async,
+    interactive_question_generation_async,
+)
+
+# ---- Background exam-generation jobs ---- #
+# Each job lives in its own directory under JOBS_DIR:
+#   job.json       status, current stage, request parameters
+#   files/         the uploaded PDFs
+#   parsed.json    output of the parse stage
+#   summaries.json output of the summarize stage
+#   result.json    final question_data
+# A stage is skipped when its output file already exists, so a job
+# interrupted by a crash or restart resumes from the last finished stage.
+# Finished jobs are deleted after JOB_TTL_SECONDS, checked at startup and by
+# the workers between jobs at most every JOB_PRUNE_INTERVAL seconds.
+
+JOBS_DIR = os.getenv("JOBS_DIR", "/tmp/exam_jobs")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "100"))
+JOB_TTL_SECONDS = int(os.getenv("JOB_TTL_SECONDS", str(24 * 3600)))
+JOB_PRUNE_INTERVAL = int(os.getenv("JOB_PRUNE_INTERVAL", "3600"))
+
+
+def _write_json(path, data):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def _read_json(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+class JobManager:
+    """Runs exam generation jobs on a bounded pool of asyncio workers."""
+
+    def __init__(self, jobs_dir=JOBS_DIR, workers=JOB_WORKERS, queue_size=JOB_QUEUE_SIZE):
+        self.jobs_dir = jobs_dir
+        self.workers = workers
+        self.queue_size = queue_size
+        self._queue = None
+        self._tasks = []
+        self._backlog = deque()  # resumed jobs that did not fit in the queue
+        self._last_prune = 0.0
+        os.makedirs(jobs_dir, exist_ok=True)
+
+    def _job_dir(self, job_id):
+        return os.path.join(self.jobs_dir, job_id)
+
+    def _job_file(self, job_id, name):
+        return os.path.join(self._job_dir(job_id), name)
+
+    async def start(self):
+        """Starts the workers and re-queues jobs left unfinished by a previous process."""
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        await self._prune()
+
+        for job_id in sorted(os.listdir(self.jobs_dir)):
+            job = self.status(job_id)
+            if job and job["status"] in ("queued", "running"):
+                if self._backlog or not self.submit(job_id):
+                    # Submitted by the workers as the queue drains.
+                    self._backlog.append(job_id)
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def create_job(self, uploads, detail_level, question_counts):
+        """
+        Persists the uploads and request parameters of a new job.
+        uploads: list of (original filename, readable binary file object).
+        """
+        job_id = uuid4().hex
+        files_dir = self._job_file(job_id, "files")
+        os.makedirs(files_dir)
+
+        file_paths = []
+        for idx, (filename, fileobj) in enumerate(uploads, start=1):
+            path = os.path.join(files_dir, f"{idx:03d}_{os.path.basename(filename)}")
+            with fileobj, open(path, "wb") as buffer:
+                shutil.copyfileobj(fileobj, buffer)
+            file_paths.append(path)
+
+        now = time.time()
+        _write_json(self._job_file(job_id, "job.json"), {
+            "job_id": job_id,
+            "status": "queued",
+            "stage": None,
+            "error": None,
+            "created_at": now,
+            "updated_at": now,
+            "detail_level": detail_level,
+            "filenames": [os.path.basename(filename) for filename, _ in uploads],
+            "file_paths": file_paths,
+            "question_counts": question_counts
+        })
+        return job_id
+
+    def submit(self, job_id):
+        """Queues a job; returns False if the queue is full."""
+        try:
+            self._queue.put_nowait(job_id)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    def discard(self, job_id):
+        shutil.rmtree(self._job_dir(job_id), ignore_errors=True)
+
+    def status(self, job_id):
+        """Returns the job record, or None for an unknown job."""
+        if os.path.basename(job_id) != job_id:
+            return None
+        job = _read_json(self._job_file(job_id, "job.json"))
+        if job is not None:
+            job["queue_depth"] = self.queue_depth()
+        return job
+
+    def queue_depth(self):
+        return (self._queue.qsize() if self._queue else 0) + len(self._backlog)
+
+    def result(self, job_id):
+        return _read_json(self._job_file(job_id, "result.json"))
+
+    def _update(self, job, **fields):
+        job.update(fields, updated_at=time.time())
+        job.pop("queue_depth", None)
+        _write_json(self._job_file(job["job_id"], "job.json"), job)
+
+    def prune(self):
+        """Deletes finished jobs older than JOB_TTL_SECONDS."""
+        cutoff = time.time() - JOB_TTL_SECONDS
+        for job_id in os.listdir(self.jobs_dir):
+            job = _read_json(self._job_file(job_id, "job.json"))
+            if job and job["status"] in ("completed", "failed") and job["updated_at"] < cutoff:
+                self.discard(job_id)
+
+    async def _prune(self):
+        self._last_prune = time.time()
+        try:
+            await asyncio.to_thread(self.prune)
+        except Exception as e:
+            print(f"Pruning {self.jobs_dir} failed: {e}")
+
+    def _refill(self):
+        """Moves backlogged jobs into the queue while it has room."""
+        while self._backlog and self.submit(self._backlog[0]):
+            self._backlog.popleft()
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._run(job_id)
+            except Exception as e:
+                print(f"Job {job_id} crashed: {e}")
+            finally:
+                self._queue.task_done()
+            self._refill()
+            if time.time() - self._last_prune >= JOB_PRUNE_INTERVAL:
+                await self._prune()
+
+    async def _stage(self, job, name, filename, produce):
+        """Loads a finished stage's output, or produces and persists it."""
+        path = self._job_file(job["job_id"], filename)
+        data = await asyncio.to_thread(_read_json, path)
+        if data is None:
+            data = await produce()
+            await asyncio.to_thread(_write_json, path, data)
+        await asyncio.to_thread(self._update, job, stage=name)
+        return data
+
+    async def _run(self, job_id):
+        # The lock keeps two worker processes sharing JOBS_DIR from running
+        # the same job; the OS releases it if this process dies.
+        lock_file = open(self._job_file(job_id, "lock"), "w")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            return
+
+        try:
+            job = self.status(job_id)
+            if job is None or job["status"] in ("completed", "failed"):
+                return
+            await asyncio.to_thread(self._update, job, status="running")
+
+            question_settings = {}
+            for upload_number, filename in enumerate(job["filenames"], start=1):
+                if filename in job["question_counts"]:
+                    question_settings[upload_number] = job["question_counts"][filename]
+
+            try:
+                parsed = await self._stage(job, "parsed", "parsed.json",
+                                           lambda: parse_multiple_pdfs_async(job["file_paths"]))
+                summaries = await self._stage(job, "summarized", "summaries.json",
+                                              lambda: summarize_from_json_input_async(parsed, detail_level=job["detail_level"]))
+                await self._stage(job, "generated", "result.json",
+                                  lambda: interactive_question_generation_async(summaries, question_settings))
+            except Exception as e:
+                await asyncio.to_thread(self._update, job, status="failed", error=str(e))
+                return
+
+            await asyncio.to_thread(self._update, job, status="completed")
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+            lock_file.close()
+
+
+job_manager = JobManager()
@@ -1,18 +1,64 @@
 from fastapi import FastAPI, File, UploadFile, Form
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 from typing import List
-import shutil
-import os
-from uuid import uuid4
 import json
 
 # Import your functions
-from generator import parse_multiple_pdfs, summarize_from_json_input, interactive_question_generation
+from async_generator import (
+    parse_multiple_pdfs_async,
+    summarize_from_json_input_async,
+    interactive_question_generation_async,
+    stream_exam_generation,
+    close_http_client,
+)
+from generator import SUMMARY_CACHE
+from disk_cache import PARSE_CACHE
+from metrics import METRICS
+from question_bank import QUESTION_BANK
+from jobs import job_manager
+from uploads import UploadSession, SessionStreamingResponse
+import asyncio
 
 app = FastAPI()
 
-UPLOAD_DIR = "/tmp/uploaded_pdfs"
-os.makedirs(UPLOAD_DIR, exist_ok=True)
+def register_gauges():
+    caches = {"parse": PARSE_CACHE, "summary": SUMMARY_CACHE}
+    for field in ("hits", "misses", "entries", "bytes"):
+        METRICS.register_gauge(
+            f"disk_cache_{field}", f"Disk cache {field}.",
+            lambda field=field: {name: cache.stats()[field] for name, cache in caches.items()},
+            label="cache"
+        )
+    METRICS.register_gauge("question_bank_questions", "Questions stored in the bank.",
+                           lambda: QUESTION_BANK.stats()["questions"])
+    METRICS.register_gauge("question_bank_unused", "Bank questions no exam has used yet.",
+                           lambda: QUESTION_BANK.stats()["unused"])
+    METRICS.register_gauge("job_queue_depth", "Background jobs waiting for a worker.",
+                           job_manager.queue_depth)
+
+register_gauges()
+
+@app.on_event("startup")
+async def startup():
+    await job_manager.start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    await job_manager.stop()
+    await close_http_client()
+
+def map_question_settings(uploads, question_settings_raw):
+    """Re-keys question counts from original filenames to upload_number."""
+    filename_to_upload_number = {}
+    for upload_num, upload in enumerate(uploads, start=1):
+        filename_to_upload_number[upload.filename] = upload_num
+
+    question_settings = {}
+    for original_filename, settings in question_settings_raw.items():
+        upload_number = filename_to_upload_number.get(original_filename)
+        if upload_number:
+            question_settings[upload_number] = settings
+    return question_settings
 
 @app.post("/generate_exam/")
 async def generate_exam(
@@ -20,49 +66,144 @@ async def generate_exam(
     detail_level: str = Form("medium"),
     question_counts: str = Form(...)  # JSON string mapping original filenames to question counts
 ):
-    file_paths = []
-    filename_to_saved_path = {}
-
     try:
         # Parse question_counts JSON string (original filenames as keys)
         question_settings_raw = json.loads(question_counts)
     except json.JSONDecodeError:
         return JSONResponse(content={"error": "Invalid JSON format in question_counts"}, status_code=400)
 
-    # Save uploaded files and track filename mapping
-    for file in files:
-        unique_name = f"{uuid4()}_{file.filename}"
-        file_path = os.path.join(UPLOAD_DIR, unique_name)
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        file_paths.append(file_path)
-        filename_to_saved_path[file.filename] = file_path
+    async with UploadSession() as session:
+        try:
+            uploads = await session.ingest(files)
+
+            # Step 1: Parse and summarize
+            parsed_data = await parse_multiple_pdfs_async(uploads)
+            summaries = await summarize_from_json_input_async(parsed_data, detail_level=detail_level)
+
+            # Step 2: Build question_settings keyed by upload_number
+            question_settings = map_question_settings(uploads, question_settings_raw)
+
+            # Step 3: Generate exam questions
+            question_data = await interactive_question_generation_async(summaries, question_settings)
+
+            return JSONResponse(content=question_data)
 
+        except Exception as e:
+            return JSONResponse(content={"error": str(e)}, status_code=500)
+
+@app.post("/generate_exam/stream/")
+async def generate_exam_stream(
+    files: List[UploadFile] = File(...),
+    detail_level: str = Form("medium"),
+    question_counts: str = Form(...),
+    format: str = Form("ndjson")  # "ndjson" or "sse"
+):
+    """Same inputs as /generate_exam/, but streams events as each stage finishes."""
     try:
-        # Step 1: Parse and summarize
-        parsed_data = parse_multiple_pdfs(file_paths)
-        summaries = summarize_from_json_input(parsed_data, detail_level=detail_level)
-
-        # Step 2: Map original filenames to upload_number by stripping UUID prefix
-        filename_to_upload_number = {}
-        for path, summary in zip(file_paths, summaries["summaries"]):
-            saved_filename = os.path.basename(path)  # e.g. "c4a9e25b-e39f-4c49-a386-dc2c9378ea27_Week6.pdf"
-            # Extract original filename after the first underscore
-            original_filename = saved_filename.split("_", 1)[1] if "_" in saved_filename else saved_filename
-            upload_num = summary["upload_number"]
-            filename_to_upload_number[original_filename] = upload_num
-
-        # Step 3: Build question_settings keyed by upload_number
-        question_settings = {}
-        for original_filename, settings in question_settings_raw.items():
-            upload_number = filename_to_upload_number.get(original_filename)
-            if upload_number:
-                question_settings[upload_number] = settings
-
-        # Step 4: Generate exam questions
-        question_data = interactive_question_generation(summaries, question_settings)
-
-        return JSONResponse(content=question_data)
+        question_settings_raw = json.loads(question_counts)
+    except json.JSONDecodeError:
+        return JSONResponse(content={"error": "Invalid JSON format in question_counts"}, status_code=400)
 
+    session = UploadSession()
+    try:
+        uploads = await session.ingest(files)
     except Exception as e:
+        session.cleanup()
         return JSONResponse(content={"error": str(e)}, status_code=500)
+    question_settings = map_question_settings(uploads, question_settings_raw)
+    use_sse = format.lower() == "sse"
+
+    def encode(event):
+        payload = json.dumps(event, ensure_ascii=False)
+        if use_sse:
+            return f"event: {event['event']}\ndata: {payload}\n\n"
+        return payload + "\n"
+
+    async def event_stream():
+        try:
+            async for event in stream_exam_generation(uploads, question_settings, detail_level=detail_level):
+                yield encode(event)
+        except Exception as e:
+            yield encode({"event": "error", "error": str(e)})
+
+    media_type = "text/event-stream" if use_sse else "application/x-ndjson"
+    # Disable proxy buffering so events reach the client as they are produced.
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    # The response cleans up the session, even if the body is never iterated.
+    return SessionStreamingResponse(session, event_stream(), media_type=media_type, headers=headers)
+
+@app.post("/jobs/generate_exam/", status_code=202)
+async def create_generate_exam_job(
+    files: List[UploadFile] = File(...),
+    detail_level: str = Form("medium"),
+    question_counts: str = Form(...)
+):
+    """Same inputs as /generate_exam/; returns a job id at once and runs in the background."""
+    try:
+        question_settings_raw = json.loads(question_counts)
+    except json.JSONDecodeError:
+        return JSONResponse(content={"error": "Invalid JSON format in question_counts"}, status_code=400)
+
+    async with UploadSession() as session:
+        uploads = await session.ingest(files)
+        job_id = await asyncio.to_thread(
+            job_manager.create_job,
+            [(upload.filename, upload.open()) for upload in uploads],
+            detail_level,
+            question_settings_raw
+        )
+    if not job_manager.submit(job_id):
+        job_manager.discard(job_id)
+        return JSONResponse(content={"error": "Too many queued jobs, retry later"}, status_code=503,
+                            headers={"Retry-After": "30"})
+
+    return JSONResponse(status_code=202, content={
+        "job_id": job_id,
+        "status_url": f"/jobs/{job_id}",
+        "result_url": f"/jobs/{job_id}/result"
+    })
+
+@app.get("/jobs/{job_id}")
+async def get_job_status(job_id: str):
+    job = job_manager.status(job_id)
+    if job is None:
+        return JSONResponse(content={"error": "Unknown job"}, status_code=404)
+    return JSONResponse(content={
+        key: job[key] for key in ("job_id", "status", "stage", "error", "created_at", "updated_at", "queue_depth")
+    })
+
+@app.get("/jobs/{job_id}/result")
+async def get_job_result(job_id: str):
+    job = job_manager.status(job_id)
+    if job is None:
+        return JSONResponse(content={"error": "Unknown job"}, status_code=404)
+    if job["status"] == "failed":
+        return JSONResponse(content={"error": job["error"]}, status_code=500)
+    if job["status"] != "completed":
+        return JSONResponse(content={"status": job["status"], "stage": job["stage"]}, status_code=202)
+    return JSONResponse(content=await asyncio.to_thread(job_manager.result, job_id))
+
+@app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(METRICS.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/summary_cache")
+async def summary_cache_stats():
+    return JSONResponse(content=SUMMARY_CACHE.stats())
+
+@app.delete("/summary_cache")
+async def clear_summary_cache():
+    removed = SUMMARY_CACHE.clear()
+    return JSONResponse(content={"removed": removed})
+
+@app.get("/question_bank")
+async def question_bank_stats():
+    return JSONResponse(content=QUESTION_BANK.stats())
+
+@app.get("/question_bank/search")
+async def search_question_bank(q: str, limit: int = 20):
+    try:
+        results = QUESTION_BANK.search(q, limit)
+    except Exception as e:
+        return JSONResponse(content={"error": str(e)}, status_code=400)
+    return JSONResponse(content={"results": results})
@@ -0,0 +1,71 @@
+import io
+import os
+from collections import namedtuple
+from pypdf import PdfReader, PdfWriter
+
+# ---- Page-range sharding for large PDFs ---- #
+# A long lecture deck is split locally into shards of PARSE_SHARD_PAGES pages
+# that are parsed concurrently and stitched back together in page order, so
+# parse latency stays roughly flat as the page count grows and one failed
+# request only costs its own page range.
+
+PARSE_SHARD_PAGES = int(os.getenv("PARSE_SHARD_PAGES", "20"))
+MAX_CONCURRENT_SHARDS = int(os.getenv("MAX_CONCURRENT_SHARDS", "4"))
+PARSE_SHARD_RETRIES = int(os.getenv("PARSE_SHARD_RETRIES", "2"))
+
+# first_page/last_page are 1-based and inclusive; whole is True when data is
+# the original, unsplit file.
+PdfShard = namedtuple("PdfShard", ["first_page", "last_page", "data", "whole"])
+
+
+def split_pdf(pdf_bytes, pages_per_shard=PARSE_SHARD_PAGES):
+    """
+    Splits a PDF into page-range shards. Small, unreadable or encrypted files
+    come back as a single shard holding the original bytes.
+    """
+    try:
+        reader = PdfReader(io.BytesIO(pdf_bytes))
+        if reader.is_encrypted:
+            raise ValueError("encrypted PDF")
+        page_count = len(reader.pages)
+    except Exception:
+        return [PdfShard(1, None, pdf_bytes, True)]
+
+    if pages_per_shard <= 0 or page_count <= pages_per_shard:
+        return [PdfShard(1, page_count, pdf_bytes, True)]
+
+    shards = []
+    for start in range(0, page_count, pages_per_shard):
+        end = min(start + pages_per_shard, page_count)
+        writer = PdfWriter()
+        for page in reader.pages[start:end]:
+            writer.add_page(page)
+        buffer = io.BytesIO()
+        writer.write(buffer)
+        shards.append(PdfShard(start + 1, end, buffer.getvalue(), False))
+    return shards
+
+
+def shard_filename(filename, shard):
+    if shard.whole:
+        return filename
+    stem, ext = os.path.splitext(filename)
+    return f"{stem}_p{shard.first_page}-{shard.last_page}{ext or '.pdf'}"
+
+
+def shard_options(options, shard):
+    """Parse options plus the page range, so each shard gets its own cache key."""
+    if shard.whole:
+        return options
+    return dict(options, pages=f"{shard.first_page}-{shard.last_page}")
+
+
+def stitch_shards(html_parts):
+    """Joins shard HTML in page order, skipping shards that failed."""
+    return "\n".join(part for part in html_parts if part)
+
+
+def describe_shard(shard):
+    if shard.whole:
+        return "whole document"
+    return f"pages {shard.first_page}-{shard.last_page}"
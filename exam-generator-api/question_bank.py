@@ -0,0 +1,160 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from dedup_index import NearDuplicateIndex
+
+# ---- Persistent question bank ---- #
+# Generated questions are stored per (document hash, section type, detail
+# level). A new exam first draws questions no earlier exam has used and only
+# asks the model for the shortfall. Each model call also generates a few
+# surplus questions that stay unused in the bank for the next variant or
+# makeup exam of the same lecture. Surplus questions that near-duplicate one
+# already in the bank are not stored, so repeated exams do not fill it with
+# rewordings of the same question.
+
+QUESTION_BANK_PATH = os.getenv("QUESTION_BANK_PATH", "/tmp/question_bank.db")
+QUESTION_BANK_SURPLUS = int(os.getenv("QUESTION_BANK_SURPLUS", "2"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS questions (
+    id INTEGER PRIMARY KEY,
+    doc_hash TEXT NOT NULL,
+    section_type TEXT NOT NULL,
+    detail_level TEXT NOT NULL,
+    context TEXT NOT NULL,
+    question_json TEXT NOT NULL,
+    times_used INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS questions_unique
+    ON questions (doc_hash, section_type, detail_level, context);
+CREATE INDEX IF NOT EXISTS questions_draw
+    ON questions (doc_hash, section_type, detail_level, times_used);
+CREATE VIRTUAL TABLE IF NOT EXISTS questions_fts
+    USING fts5(context, content='questions', content_rowid='id');
+CREATE TRIGGER IF NOT EXISTS questions_ai AFTER INSERT ON questions BEGIN
+    INSERT INTO questions_fts (rowid, context) VALUES (new.id, new.context);
+END;
+CREATE TRIGGER IF NOT EXISTS questions_ad AFTER DELETE ON questions BEGIN
+    INSERT INTO questions_fts (questions_fts, rowid, context) VALUES ('delete', old.id, old.context);
+END;
+"""
+
+
+class QuestionBank:
+    """SQLite-backed store of generated questions with full-text search."""
+
+    def __init__(self, path=QUESTION_BANK_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        self._index = None
+        self._index_lock = threading.Lock()
+
+    def draw(self, doc_hash, section_type, detail_level, count):
+        """Takes up to count unused questions and marks them used."""
+        if count <= 0:
+            return []
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._conn.execute(
+                    "SELECT id, question_json FROM questions "
+                    "WHERE doc_hash = ? AND section_type = ? AND detail_level = ? AND times_used = 0 "
+                    "ORDER BY id LIMIT ?",
+                    (doc_hash, section_type, detail_level, count)
+                ).fetchall()
+                self._conn.executemany(
+                    "UPDATE questions SET times_used = times_used + 1 WHERE id = ?",
+                    [(row[0],) for row in rows]
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return [json.loads(row[1]) for row in rows]
+
+    def near_duplicate_index(self):
+        """Process-wide index of stored question texts, seeded from the bank on first use."""
+        with self._index_lock:
+            if self._index is None:
+                index = NearDuplicateIndex()
+                for context in self.contexts():
+                    index.add(context)
+                self._index = index
+            return self._index
+
+    def release(self, doc_hash, section_type, detail_level, questions):
+        """Returns drawn questions that never reached an exam to the unused pool."""
+        if not questions:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE questions SET times_used = times_used - 1 "
+                "WHERE doc_hash = ? AND section_type = ? AND detail_level = ? AND context = ? "
+                "AND times_used > 0",
+                [(doc_hash, section_type, detail_level, q["context"]) for q in questions]
+            )
+
+    def store(self, doc_hash, section_type, detail_level, questions, used=False):
+        """
+        Adds questions to the bank; exact repeats of stored questions are
+        ignored. Unused (surplus) questions are also dropped when they
+        near-duplicate a stored question.
+        """
+        index = self.near_duplicate_index()
+        if used:
+            for q in questions:
+                index.add(q["context"])
+        else:
+            questions = [q for q in questions if index.add_if_new(q["context"])]
+        now = time.time()
+        rows = [
+            (doc_hash, section_type, detail_level, q["context"],
+             json.dumps({k: v for k, v in q.items() if k != "question_number"}, ensure_ascii=False),
+             1 if used else 0, now)
+            for q in questions
+        ]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO questions "
+                "(doc_hash, section_type, detail_level, context, question_json, times_used, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+
+    def search(self, query, limit=20):
+        """Full-text search over stored question texts."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT q.doc_hash, q.section_type, q.detail_level, q.question_json, q.times_used "
+                "FROM questions_fts f JOIN questions q ON q.id = f.rowid "
+                "WHERE questions_fts MATCH ? ORDER BY rank LIMIT ?",
+                (query, limit)
+            ).fetchall()
+        return [
+            {"doc_hash": r[0], "section_type": r[1], "detail_level": r[2],
+             "question": json.loads(r[3]), "times_used": r[4]}
+            for r in rows
+        ]
+
+    def contexts(self):
+        """Yields every stored question text, e.g. to seed a near-duplicate index."""
+        with self._lock:
+            rows = self._conn.execute("SELECT context FROM questions").fetchall()
+        for row in rows:
+            yield row[0]
+
+    def stats(self):
+        with self._lock:
+            total, unused = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(times_used = 0), 0) FROM questions"
+            ).fetchone()
+        return {"questions": total, "unused": unused}
+
+
+QUESTION_BANK = QuestionBank()
@@ -0,0 +1,99 @@
+import json
+
+# ---- Tolerant parsing of generated question arrays ---- #
+# The model sometimes returns a JSON array with one broken object, a missing
+# comma, or output cut off mid-array. Rather than rejecting the whole section,
+# keep every object that decodes and validates, and report which
+# question_numbers still need to be generated.
+
+CHOICE_KEYS = {"A", "B", "C", "D"}
+
+_decoder = json.JSONDecoder()
+
+
+def iter_json_objects(text):
+    """Yields each JSON object that decodes cleanly from text, skipping broken ones."""
+    pos = text.find("{")
+    while pos != -1:
+        try:
+            obj, end = _decoder.raw_decode(text, pos)
+        except json.JSONDecodeError:
+            # Broken or truncated object: resume at the next opening brace.
+            pos = text.find("{", pos + 1)
+            continue
+        yield obj
+        pos = text.find("{", end)
+
+
+def validate_question(question, section_type):
+    """
+    Checks a decoded question against the schema requested for its section.
+    The type is compared case-insensitively ("true/false") and rewritten to
+    section_type.
+    """
+    if not isinstance(question, dict):
+        return False
+    qtype = question.get("type")
+    if not isinstance(qtype, str) or qtype.strip().casefold() != section_type.casefold():
+        return False
+
+    text = question.get("context")
+    if not isinstance(text, str) or not text.strip():
+        return False
+
+    answer = question.get("answer")
+    if answer is None or str(answer).strip() == "":
+        return False
+
+    if section_type == "Multiple Choice":
+        choices = question.get("choices")
+        if not isinstance(choices, dict) or set(choices) != CHOICE_KEYS:
+            return False
+        if str(answer).strip().upper() not in CHOICE_KEYS:
+            return False
+
+    question["type"] = section_type
+    return True
+
+
+def question_number_of(question):
+    try:
+        return int(question.get("question_number"))
+    except (TypeError, ValueError):
+        return None
+
+
+def salvage_section(raw_output, count, section_type, start_q_number):
+    """
+    Extracts the valid questions of a section from raw model output.
+    Returns (questions, missing_numbers): at most count questions, and the
+    question_numbers in start_q_number..start_q_number+count-1 still to fill.
+    """
+    expected = list(range(start_q_number, start_q_number + count))
+    questions = []
+    seen_numbers = set()
+
+    for obj in iter_json_objects(raw_output):
+        if len(questions) >= count:
+            break
+        if not validate_question(obj, section_type):
+            continue
+        number = question_number_of(obj)
+        if number in seen_numbers:
+            continue
+        if number is not None:
+            seen_numbers.add(number)
+        questions.append(obj)
+
+    shortfall = count - len(questions)
+    missing_numbers = [n for n in expected if n not in seen_numbers][:shortfall]
+    return questions, missing_numbers
+
+
+def merge_followup(questions, extra, missing_numbers):
+    """Numbers follow-up questions into the missing slots; returns the slots still empty."""
+    for number, question in zip(missing_numbers, extra):
+        question["question_number"] = number
+        questions.append(question)
+    questions.sort(key=lambda q: (question_number_of(q) is None, question_number_of(q) or 0))
+    return missing_numbers[len(extra):]
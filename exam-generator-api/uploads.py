@@ -0,0 +1,213 @@
+import io
+import os
+import shutil
+import hashlib
+import asyncio
+import tempfile
+import zipfile
+from starlette.responses import StreamingResponse
+
+# ---- Upload ingestion shared by the generator and grader services ---- #
+# Each upload is read once, in chunks, and hashed during that pass. Small files
+# stay in memory until the request's memory budget is used up; larger ones,
+# and every upload after that, spill to a temp directory private to the
+# request, which is removed when the request finishes. Identical uploads
+# within one request share the same stored bytes.
+
+UPLOAD_TMP_DIR = os.getenv("UPLOAD_TMP_DIR", tempfile.gettempdir())
+UPLOAD_MEMORY_LIMIT = int(os.getenv("UPLOAD_MEMORY_LIMIT", str(8 * 1024 * 1024)))
+UPLOAD_SESSION_MEMORY_LIMIT = int(os.getenv("UPLOAD_SESSION_MEMORY_LIMIT", str(32 * 1024 * 1024)))
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+# Limits for zip archives expanded into a session, checked before extracting.
+UPLOAD_ZIP_MAX_MEMBERS = int(os.getenv("UPLOAD_ZIP_MAX_MEMBERS", "1000"))
+UPLOAD_ZIP_MAX_BYTES = int(os.getenv("UPLOAD_ZIP_MAX_BYTES", str(1024 * 1024 * 1024)))
+
+
+class StoredUpload:
+    """An ingested upload: original filename, SHA-256, size, and its bytes in memory or on disk."""
+
+    def __init__(self, filename, sha256, size, data=None, path=None):
+        self.filename = filename
+        self.sha256 = sha256
+        self.size = size
+        self.data = data
+        self.path = path
+
+    def read_bytes(self):
+        if self.data is not None:
+            return self.data
+        with open(self.path, "rb") as f:
+            return f.read()
+
+    def open(self):
+        """Returns a readable binary file object named after the original file."""
+        if self.data is not None:
+            buffer = io.BytesIO(self.data)
+            buffer.name = self.filename
+            return buffer
+        return open(self.path, "rb")
+
+
+def load_document(document):
+    """Returns (filename, bytes, sha256 or None) for a file path or a StoredUpload."""
+    if isinstance(document, StoredUpload):
+        return document.filename, document.read_bytes(), document.sha256
+    with open(document, "rb") as f:
+        return os.path.basename(document), f.read(), None
+
+
+def open_document(document):
+    """Opens a file path or a StoredUpload for binary reading."""
+    if isinstance(document, StoredUpload):
+        return document.open()
+    return open(document, "rb")
+
+
+class _ThreadedReader:
+    """Gives a blocking file object the async read() of a FastAPI UploadFile."""
+
+    def __init__(self, filename, fileobj):
+        self.filename = filename
+        self._fileobj = fileobj
+
+    async def read(self, size=-1):
+        return await asyncio.to_thread(self._fileobj.read, size)
+
+
+class UploadSession:
+    """Per-request upload storage, deleted by cleanup() or on leaving an async with block."""
+
+    def __init__(self, memory_limit=UPLOAD_MEMORY_LIMIT, session_memory_limit=UPLOAD_SESSION_MEMORY_LIMIT,
+                 base_dir=UPLOAD_TMP_DIR):
+        self.memory_limit = memory_limit                  # per upload
+        self.session_memory_limit = session_memory_limit  # all uploads of the session together
+        self.base_dir = base_dir
+        self.uploads = []
+        self.memory_used = 0
+        self._by_hash = {}
+        self._temp_dir = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.cleanup()
+
+    def _open_spill(self):
+        """Returns (path, file) of a new spill file unique within the session."""
+        if self._temp_dir is None:
+            self._temp_dir = tempfile.mkdtemp(prefix="upload_", dir=self.base_dir)
+        fd, path = tempfile.mkstemp(suffix=".bin", dir=self._temp_dir)
+        return path, os.fdopen(fd, "wb")
+
+    async def add(self, upload):
+        """Streams one FastAPI UploadFile into the session."""
+        digest = hashlib.sha256()
+        chunks = []
+        size = 0
+        spill = None
+        path = None
+        memory_limit = min(self.memory_limit, self.session_memory_limit - self.memory_used)
+
+        try:
+            while True:
+                chunk = await upload.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                size += len(chunk)
+                if spill is None and size > memory_limit:
+                    path, spill = self._open_spill()
+                    await asyncio.to_thread(spill.writelines, chunks)
+                    chunks = []
+                if spill is not None:
+                    await asyncio.to_thread(spill.write, chunk)
+                else:
+                    chunks.append(chunk)
+        finally:
+            if spill is not None:
+                spill.close()
+
+        sha256 = digest.hexdigest()
+        original = self._by_hash.get(sha256)
+        if original is not None:
+            # Same bytes uploaded twice: keep one copy.
+            if path is not None:
+                os.remove(path)
+            stored = StoredUpload(upload.filename, sha256, size, data=original.data, path=original.path)
+        elif spill is not None:
+            stored = StoredUpload(upload.filename, sha256, size, path=path)
+        else:
+            stored = StoredUpload(upload.filename, sha256, size, data=b"".join(chunks))
+            self.memory_used += size
+
+        self._by_hash.setdefault(sha256, stored)
+        self.uploads.append(stored)
+        return stored
+
+    async def ingest(self, uploads):
+        """Streams every upload in order and returns their StoredUploads."""
+        return [await self.add(upload) for upload in uploads]
+
+    async def add_zip(self, upload):
+        """
+        Expands a zip upload into the session, one StoredUpload per file in
+        archive order. Directories, hidden files and macOS metadata are skipped.
+        Raises ValueError for invalid or oversized archives.
+        """
+        archive = await self.add(upload)
+        # Only its members are kept, so the archive itself is not listed.
+        self.uploads.remove(archive)
+        try:
+            with archive.open() as fileobj, zipfile.ZipFile(fileobj) as zf:
+                members = [
+                    info for info in zf.infolist()
+                    if not info.is_dir()
+                    and not info.filename.startswith("__MACOSX/")
+                    and not os.path.basename(info.filename).startswith(".")
+                ]
+                if len(members) > UPLOAD_ZIP_MAX_MEMBERS:
+                    raise ValueError(f"Zip has more than {UPLOAD_ZIP_MAX_MEMBERS} files")
+                if sum(info.file_size for info in members) > UPLOAD_ZIP_MAX_BYTES:
+                    raise ValueError(f"Zip expands to more than {UPLOAD_ZIP_MAX_BYTES} bytes")
+
+                stored = []
+                for info in members:
+                    with zf.open(info) as member:
+                        reader = _ThreadedReader(os.path.basename(info.filename), member)
+                        stored.append(await self.add(reader))
+                return stored
+        except zipfile.BadZipFile as e:
+            raise ValueError(f"Invalid zip file: {e}")
+
+    def cleanup(self):
+        if self._temp_dir is not None:
+            shutil.rmtree(self._temp_dir, ignore_errors=True)
+            self._temp_dir = None
+        self.uploads = []
+        self.memory_used = 0
+        self._by_hash = {}
+
+
+class SessionStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse whose body uses an UploadSession. However the response
+    ends, including a client that disconnects before the body is iterated,
+    the body generator is closed (running its finally blocks) and the
+    session cleaned up.
+    """
+
+    def __init__(self, session, content, **kwargs):
+        super().__init__(content, **kwargs)
+        self.session = session
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            try:
+                aclose = getattr(self.body_iterator, "aclose", None)
+                if aclose is not None:
+                    await aclose()
+            finally:
+                self.session.cleanup()
@@ -0,0 +1,109 @@
+import os
+import json
+import time
+import threading
+from collections import OrderedDict
+from disk_cache import file_digest
+from uploads import load_document
+
+# ---- Compiled answer keys ---- #
+# An answer key PDF is parsed once into a small JSON artifact (question
+# numbers, answers, detected types, source hash). Grading a class then
+# references the artifact by id and never touches the PDF again. The id is
+# the SHA-256 of the source PDF, so uploading the same key twice reuses the
+# artifact. Bump ANSWER_KEY_FORMAT_VERSION whenever extraction or type
+# detection changes; artifacts of older versions are recompiled on demand.
+
+ANSWER_KEY_DIR = os.getenv("ANSWER_KEY_DIR", "/tmp/answer_keys")
+ANSWER_KEY_FORMAT_VERSION = 1
+ANSWER_KEY_MEMORY_ENTRIES = 64
+
+
+class AnswerKeyStore:
+    """Versioned answer-key artifacts on disk, with the most recent kept in memory."""
+
+    def __init__(self, directory=ANSWER_KEY_DIR, version=ANSWER_KEY_FORMAT_VERSION,
+                 memory_entries=ANSWER_KEY_MEMORY_ENTRIES):
+        self.directory = directory
+        self.version = version
+        self.memory_entries = memory_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, answer_key_id):
+        return os.path.join(self.directory, f"{answer_key_id}.v{self.version}.json")
+
+    def _remember(self, artifact):
+        with self._lock:
+            self._memory[artifact["answer_key_id"]] = artifact
+            self._memory.move_to_end(artifact["answer_key_id"])
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def get(self, answer_key_id):
+        """Returns the artifact of the current version, or None."""
+        if os.path.basename(answer_key_id) != answer_key_id:
+            return None
+        with self._lock:
+            artifact = self._memory.get(answer_key_id)
+            if artifact is not None:
+                self._memory.move_to_end(answer_key_id)
+                return artifact
+        try:
+            with open(self._path(answer_key_id), encoding="utf-8") as f:
+                artifact = json.load(f)
+        except FileNotFoundError:
+            return None
+        self._remember(artifact)
+        return artifact
+
+    def compile(self, document, extract_answers):
+        """
+        Returns the artifact for an answer key (file path or StoredUpload),
+        running extract_answers(document) only if none is stored yet.
+        """
+        filename, pdf_bytes, file_hash = load_document(document)
+        answer_key_id = file_hash or file_digest(pdf_bytes)
+        artifact = self.get(answer_key_id)
+        if artifact is not None:
+            return artifact
+
+        artifact = {
+            "answer_key_id": answer_key_id,
+            "version": self.version,
+            "source_sha256": answer_key_id,
+            "source_filename": filename,
+            "compiled_at": time.time(),
+            "answers": extract_answers(document),
+        }
+        path = self._path(answer_key_id)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(artifact, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        self._remember(artifact)
+        return artifact
+
+    def delete(self, answer_key_id):
+        """Removes an artifact; returns False if it did not exist."""
+        if os.path.basename(answer_key_id) != answer_key_id:
+            return False
+        with self._lock:
+            self._memory.pop(answer_key_id, None)
+        try:
+            os.remove(self._path(answer_key_id))
+            return True
+        except FileNotFoundError:
+            return False
+
+
+def model_answers_from(artifact):
+    """Maps question number to {"answer", "type"}, the shape grade_exam expects."""
+    return {
+        item["question"]: {"answer": item["answer"], "type": item["type"]}
+        for item in artifact["answers"]
+    }
+
+
+ANSWER_KEY_STORE = AnswerKeyStore()
@@ -0,0 +1,162 @@
+import numpy as np
+
+# ---- Class score matrix ---- #
+# Grades the objective questions (multiple choice, true/false, numerical) of
+# a whole class at once. Answers are loaded into a student x question array,
+# each question type is compared against the key column-wise, and item
+# statistics are computed from the resulting 0/1 score matrix:
+#   difficulty      share of students answering correctly (p-value)
+#   discrimination  correlation of the item with the rest of the test
+#                   (corrected point-biserial; None when undefined)
+#   distractors     how many students chose each option (mcq, true/false)
+
+OBJECTIVE_TYPES = ("mcq", "truefalse", "numerical")
+NUMERIC_TOLERANCE = 0.01
+
+# detect_type() labels true/false answers "tf".
+TYPE_ALIASES = {"tf": "truefalse"}
+
+
+def normalize_type(qtype):
+    return TYPE_ALIASES.get(qtype, qtype)
+
+
+# Vectorized string ufuncs on NumPy 2, the older np.char functions otherwise.
+_strings = getattr(np, "strings", np.char)
+
+
+def to_floats(values):
+    """Parses an array of strings to floats, NaN where float() would fail."""
+    try:
+        return values.astype(float)
+    except ValueError:
+        pass
+    # A class gives few distinct answers per question, so parse each once.
+    distinct, inverse = np.unique(values, return_inverse=True)
+    parsed = np.empty(len(distinct))
+    for i, value in enumerate(distinct):
+        try:
+            parsed[i] = float(value)
+        except ValueError:
+            parsed[i] = np.nan
+    return parsed[inverse].reshape(values.shape)
+
+
+class ClassGrades:
+    """
+    Array-backed grades of one class. Rows follow the order students were
+    passed in, columns follow question_numbers.
+    """
+
+    def __init__(self, question_numbers, types, key, answers, correct):
+        self.question_numbers = question_numbers  # list of q question numbers
+        self.types = types                        # (q,) question type per column
+        self.key = key                            # (q,) normalized correct answers
+        self.answers = answers                    # (n, q) normalized student answers, "" if blank
+        self.correct = correct                    # (n, q) bool
+
+    @property
+    def scores(self):
+        return self.correct.astype(np.float64)
+
+    @property
+    def totals(self):
+        return self.correct.sum(axis=1)
+
+    def difficulty(self):
+        if not len(self.answers):
+            return np.full(len(self.question_numbers), np.nan)
+        return self.correct.mean(axis=0)
+
+    def discrimination(self):
+        if not len(self.answers):
+            return np.full(len(self.question_numbers), np.nan)
+        scores = self.scores
+        rest = scores.sum(axis=1, keepdims=True) - scores
+        item_dev = scores - scores.mean(axis=0)
+        rest_dev = rest - rest.mean(axis=0)
+        numerator = (item_dev * rest_dev).sum(axis=0)
+        denominator = np.sqrt((item_dev ** 2).sum(axis=0) * (rest_dev ** 2).sum(axis=0))
+        out = np.full(len(self.question_numbers), np.nan)
+        np.divide(numerator, denominator, out=out, where=denominator > 0)
+        return out
+
+    def distractors(self):
+        """{question number: {option: count}} for mcq and true/false columns."""
+        frequencies = {}
+        for j, question in enumerate(self.question_numbers):
+            if self.types[j] == "numerical":
+                continue
+            options, counts = np.unique(self.answers[:, j], return_counts=True)
+            frequencies[question] = {
+                str(option): int(count) for option, count in zip(options, counts) if option
+            }
+        return frequencies
+
+    def item_statistics(self):
+        """One JSON-ready dict per question."""
+        difficulty, discrimination = self.difficulty(), self.discrimination()
+        distractors = self.distractors()
+        omitted = (self.answers == "").sum(axis=0)
+        items = []
+        for j, question in enumerate(self.question_numbers):
+            item = {
+                "question_number": question,
+                "type": str(self.types[j]),
+                "correct_answer": str(self.key[j]),
+                "difficulty": None if np.isnan(difficulty[j]) else round(float(difficulty[j]), 4),
+                "discrimination": None if np.isnan(discrimination[j]) else round(float(discrimination[j]), 4),
+                "omitted": int(omitted[j]),
+            }
+            if question in distractors:
+                item["distractors"] = distractors[question]
+            items.append(item)
+        return items
+
+
+def grade_class(students, model_answers):
+    """
+    students: one answer list per student, as returned by answer extraction
+    ({"question_number", "answer"}). model_answers: question number ->
+    {"answer", "type"}. Only objective questions are graded.
+    """
+    questions = [
+        q for q, model in model_answers.items()
+        if normalize_type(model.get("type", "short")) in OBJECTIVE_TYPES and model.get("answer")
+    ]
+    column = {q: j for j, q in enumerate(questions)}
+    types = np.array([normalize_type(model_answers[q]["type"]) for q in questions], dtype=object)
+
+    rows = []
+    for answers in students:
+        row = [""] * len(questions)
+        for answer in answers:
+            j = column.get(answer.get("question_number"))
+            if j is not None and answer.get("answer") is not None:
+                row[j] = str(answer["answer"])
+        rows.append(row)
+    raw = _strings.strip(np.array(rows, dtype=str).reshape(len(students), len(questions)))
+    key = _strings.strip(np.array([str(model_answers[q]["answer"]) for q in questions], dtype=str))
+
+    answers = raw.copy()
+    correct = np.zeros(raw.shape, dtype=bool)
+
+    columns = types == "mcq"
+    if columns.any():
+        answers[:, columns] = _strings.upper(raw[:, columns])
+        key[columns] = _strings.upper(key[columns])
+        correct[:, columns] = answers[:, columns] == key[columns]
+
+    columns = types == "truefalse"
+    if columns.any():
+        answers[:, columns] = _strings.lower(raw[:, columns])
+        key[columns] = _strings.lower(key[columns])
+        correct[:, columns] = answers[:, columns] == key[columns]
+
+    columns = types == "numerical"
+    if columns.any():
+        difference = np.abs(to_floats(raw[:, columns]) - to_floats(key[columns]))
+        correct[:, columns] = difference <= NUMERIC_TOLERANCE
+
+    correct &= answers != ""
+    return ClassGrades(questions, types, key, answers, correct)
@@ -0,0 +1,155 @@
+import os
+import json
+import zlib
+import hashlib
+import threading
+from collections import OrderedDict
+
+# ---- Content-addressed cache for document-parse results ---- #
+# Shared by the generator and grader services: both send PDFs to the same
+# document-digitization endpoint with the same options, so a lecture deck or
+# answer key parsed by one service is a cache hit for the other. Any number of
+# processes may share a directory: lookups fall back to the files on disk, and
+# eviction works on the directory's actual contents, ordered by mtime (which a
+# hit refreshes), rather than on what one process wrote.
+
+PARSE_CACHE_DIR = os.getenv("PARSE_CACHE_DIR", "/tmp/parse_cache")
+PARSE_CACHE_MAX_BYTES = int(os.getenv("PARSE_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+
+
+def file_digest(data: bytes) -> str:
+    """Returns the SHA-256 hex digest of raw file bytes."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def parse_cache_key(file_hash: str, options: dict) -> str:
+    """Builds a cache key from a file hash and the parse options sent with it."""
+    payload = json.dumps(options, sort_keys=True)
+    return hashlib.sha256(f"{file_hash}:{payload}".encode("utf-8")).hexdigest()
+
+
+class DiskCache:
+    """Size-bounded LRU cache storing zlib-compressed text values on disk."""
+
+    def __init__(self, directory, max_bytes=PARSE_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> compressed size, least recent first
+        self._total_bytes = 0
+        os.makedirs(directory, exist_ok=True)
+        with self._lock:
+            self._sync_index()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.z")
+
+    def _sync_index(self):
+        # Rebuild recency order from the files on disk, including those written
+        # or evicted by other processes, so eviction survives restarts and sees
+        # the directory's real size. Caller holds the lock.
+        found = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".z"):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                continue
+            found.append((stat.st_mtime, name[:-2], stat.st_size))
+        self._entries.clear()
+        self._total_bytes = 0
+        for _, key, size in sorted(found):
+            self._entries[key] = size
+            self._total_bytes += size
+
+    def get(self, key):
+        """Returns the cached text for key, or None on a miss."""
+        with self._lock:
+            # Not checked against the index first: another process sharing the
+            # directory may have written the file since the index was built.
+            try:
+                with open(self._path(key), "rb") as f:
+                    blob = f.read()
+                os.utime(self._path(key))
+            except FileNotFoundError:
+                # Never stored, or evicted by another worker sharing the directory.
+                if key in self._entries:
+                    self._total_bytes -= self._entries.pop(key)
+                self.misses += 1
+                return None
+            if key in self._entries:
+                self._entries.move_to_end(key)
+            else:
+                self._entries[key] = len(blob)
+                self._total_bytes += len(blob)
+            self.hits += 1
+        return zlib.decompress(blob).decode("utf-8")
+
+    def put(self, key, text):
+        """Stores text under key and evicts least recently used entries."""
+        blob = zlib.compress(text.encode("utf-8"))
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(blob)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self._sync_index()
+            self._evict()
+
+    def delete(self, key):
+        """Removes key from the cache; returns True if it was present."""
+        with self._lock:
+            size = self._entries.pop(key, None)
+            if size is not None:
+                self._total_bytes -= size
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            return False
+        return True
+
+    def clear(self):
+        """Removes every entry and resets the counters."""
+        with self._lock:
+            self._sync_index()
+            keys = list(self._entries)
+            self._entries.clear()
+            self._total_bytes = 0
+            self.hits = 0
+            self.misses = 0
+        for key in keys:
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+        return len(keys)
+
+    def _evict(self):
+        while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            old_key, size = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            try:
+                os.remove(self._path(old_key))
+            except FileNotFoundError:
+                pass
+
+    def stats(self):
+        """Returns hit/miss counters and current size."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+PARSE_CACHE = DiskCache(PARSE_CACHE_DIR)
@@ -1,26 +1,61 @@
 import os
+import threading
 import json
-import requests
 import re
+from concurrent.futures import ThreadPoolExecutor
 from bs4 import BeautifulSoup
+from disk_cache import PARSE_CACHE, file_digest, parse_cache_key
+from uploads import load_document, open_document
+from transport import UPSTAGE_BASE_URL, openai_client, post_with_retry
+from metrics import traced, current_span
+from answer_keys import ANSWER_KEY_STORE, model_answers_from
+from pregrader import pregrade, PregradeStats, PREGRADE_TOTALS
 
 # ---- API Configuration ---- #
-API_KEY = os.getenv("UPSTAGE_API_KEY")
-if not API_KEY:
-    raise ValueError("Missing UPSTAGE_API_KEY environment variable.")
+# The key is read and the Solar client built on first use (or by warm_up()),
+# so importing this module never fails or blocks.
+OCR_URL = f"{UPSTAGE_BASE_URL}/document-digitization"
+DOC_PARSER_URL = f"{UPSTAGE_BASE_URL}/document-digitization"
+DOC_PARSER_TIMEOUT = float(os.getenv("PARSE_TIMEOUT", "300"))
+DOC_PARSER_OPTIONS = {
+    "ocr": "force",
+    "base64_encoding": "['table']",
+    "model": "document-parse"
+}
 
-HEADERS = {"Authorization": f"Bearer {API_KEY}"}
-OCR_URL = "https://api.upstage.ai/v1/document-digitization"
-DOC_PARSER_URL = "https://api.upstage.ai/v1/document-digitization"
-from openai import OpenAI
-SOLAR_CLIENT = OpenAI(api_key=API_KEY, base_url="https://api.upstage.ai/v1")
+_solar_client = None
+_client_lock = threading.Lock()
+
+def get_api_key():
+    api_key = os.getenv("UPSTAGE_API_KEY")
+    if not api_key:
+        raise ValueError("Missing UPSTAGE_API_KEY environment variable.")
+    return api_key
+
+def auth_headers():
+    return {"Authorization": f"Bearer {get_api_key()}"}
+
+def get_solar_client():
+    global _solar_client
+    if _solar_client is None:
+        with _client_lock:
+            if _solar_client is None:
+                _solar_client = openai_client(get_api_key())
+    return _solar_client
+
+def warm_up():
+    """Validates the API key and builds the Solar client ahead of the first request."""
+    get_solar_client()
 
 # ---- OCR Function ---- #
+@traced("ocr_image")
 def ocr_image(file_like):
-    files = {"document": (getattr(file_like, 'name', 'file'), file_like)}
+    # Read once so a retried request sends the same bytes again.
+    image_bytes = file_like.read()
+    current_span().add_payload(len(image_bytes))
+    files = {"document": (getattr(file_like, 'name', 'file'), image_bytes)}
     data = {"model": "ocr"}
-    response = requests.post(OCR_URL, headers=HEADERS, files=files, data=data)
-    response.raise_for_status()
+    response = post_with_retry(OCR_URL, headers=auth_headers(), files=files, data=data)
     return response.json()
 
 # ---- Extract Answers from Answer Key ---- #
@@ -34,22 +69,26 @@ def detect_type(ans: str) -> str:
         return "numerical"
     return "short"
 
-def extract_answers_from_pdf(filename: str) -> list:
-    if not os.path.exists(filename):
+@traced("extract_answers_from_pdf")
+def extract_answers_from_pdf(filename) -> list:
+    """filename: path of the answer key PDF, or a StoredUpload."""
+    if isinstance(filename, str) and not os.path.exists(filename):
         raise FileNotFoundError(f"{filename} not found.")
 
-    with open(filename, "rb") as file:
-        files = {"document": file}
-        data = {
-            "ocr": "force",
-            "base64_encoding": "['table']",
-            "model": "document-parse"
-        }
-        response = requests.post(DOC_PARSER_URL, headers=HEADERS, files=files, data=data)
-        response.raise_for_status()
+    name, pdf_bytes, file_hash = load_document(filename)
+    current_span().add_payload(len(pdf_bytes))
+
+    cache_key = parse_cache_key(file_hash or file_digest(pdf_bytes), DOC_PARSER_OPTIONS)
+    html_content = PARSE_CACHE.get(cache_key)
+    if html_content is None:
+        files = {"document": (name, pdf_bytes)}
+        response = post_with_retry(DOC_PARSER_URL, timeout=DOC_PARSER_TIMEOUT,
+                                   headers=auth_headers(), files=files, data=DOC_PARSER_OPTIONS)
         result = response.json()
+        html_content = result.get("content", {}).get("html", "")
+        if html_content:
+            PARSE_CACHE.put(cache_key, html_content)
 
-    html_content = result.get("content", {}).get("html", "")
     soup = BeautifulSoup(html_content, "html.parser")
 
     answers = []
@@ -68,6 +107,7 @@ def extract_answers_from_pdf(filename: str) -> list:
 # ---- Extract Questions from HTML ---- #
 
 # ---- Extract Student Answers Using Solar ---- #
+@traced("extract_answers_from_context_with_solar")
 def extract_answers_from_context_with_solar(context_text):
     prompt = (
         "You are an expert exam parser.\n"
@@ -76,12 +116,14 @@ def extract_answers_from_context_with_solar(context_text):
         "For MCQs, answer must be only A/B/C/D. For others, return the full student response.\n"
         f"Context:\n{context_text}\n\nExtracted JSON:"
     )
+    current_span().add_payload(len(prompt.encode("utf-8")))
 
-    response = SOLAR_CLIENT.chat.completions.create(
+    response = get_solar_client().chat.completions.create(
         model="solar-pro",
         messages=[{"role": "user", "content": prompt}],
         stream=False
     )
+    current_span().add_usage(response.usage)
 
     content = response.choices[0].message.content.strip()
     if content.startswith("```json"): content = content[len("```json"):].strip()
@@ -89,9 +131,11 @@ def extract_answers_from_context_with_solar(context_text):
     try:
         return json.loads(content)
     except json.JSONDecodeError:
+        current_span().fail()
         return []
 
 # ---- Grading ---- #
+@traced("solar_score")
 def solar_score(student_ans, correct_ans):
     prompt = (
         f"You are an exam grading AI.\n"
@@ -103,12 +147,14 @@ def solar_score(student_ans, correct_ans):
         f"Student Answer: {student_ans}\n\n"
         f"Score (0-100):"
     )
+    current_span().add_payload(len(prompt.encode("utf-8")))
 
-    response = SOLAR_CLIENT.chat.completions.create(
+    response = get_solar_client().chat.completions.create(
         model="solar-pro",
         messages=[{"role": "user", "content": prompt}],
         stream=False
     )
+    current_span().add_usage(response.usage)
 
     content = response.choices[0].message.content.strip()
     match = re.search(r"(\d{1,3})(?!\d)", content)
@@ -117,12 +163,111 @@ def solar_score(student_ans, correct_ans):
         return max(0, min(score, 100)) / 100.0
     else:
         return 0.0
-    
-def grade_question(student_ans, correct_ans, qtype="short"):
+
+# ---- Batched Grading ---- #
+# Short answers are scored SCORE_BATCH_SIZE at a time in one structured prompt,
+# with up to MAX_CONCURRENT_SCORE_BATCHES prompts in flight. Items missing or
+# invalid in a batch reply are re-scored one by one with solar_score().
+SCORE_BATCH_SIZE = int(os.getenv("SCORE_BATCH_SIZE", "10"))
+MAX_CONCURRENT_SCORE_BATCHES = int(os.getenv("MAX_CONCURRENT_SCORE_BATCHES", "4"))
+
+_SCORE_OBJECT = re.compile(r"\{[^{}]*\}")
+
+def build_batch_score_prompt(items):
+    """items: list of {"id", "question", "expected", "student"}."""
+    lines = [
+        "You are an exam grading AI.",
+        "Sometimes the student's answer may contain spacing or formatting errors due to OCR or parsing mistakes.",
+        "Your job is to evaluate the actual meaning. If the student's answer is actually correct but formatted wrong (like '1 2' instead of '12'), treat it as correct.",
+        "For each item below, return how accurate the student's answer is as a number from 0 to 100.",
+        "",
+        "Return only a JSON array with one object per item, in the form:",
+        '[{"id": 1, "score": 85}]',
+        "",
+    ]
+    for item in items:
+        lines.append(json.dumps({
+            "id": item["id"],
+            "question": item["question"],
+            "correct_answer": item["expected"],
+            "student_answer": item["student"]
+        }, ensure_ascii=False))
+    return "\n".join(lines)
+
+def parse_batch_scores(content, ids):
+    """
+    Returns {id: score in 0..1} for every well-formed object in the reply.
+    Unknown ids, repeated ids and out-of-range scores are dropped.
+    """
+    expected = set(ids)
+    scores = {}
+    for match in _SCORE_OBJECT.finditer(content):
+        try:
+            obj = json.loads(match.group(0))
+            item_id, score = obj["id"], obj["score"]
+        except (json.JSONDecodeError, KeyError, TypeError):
+            continue
+        if item_id not in expected or item_id in scores:
+            continue
+        if isinstance(score, bool) or not isinstance(score, (int, float)) or not 0 <= score <= 100:
+            continue
+        scores[item_id] = score / 100.0
+    return scores
+
+@traced("solar_score_batch")
+def solar_score_batch(items):
+    """Scores a batch of items in one call; returns {id: score} for the items it could parse."""
+    prompt = build_batch_score_prompt(items)
+    current_span().add_payload(len(prompt.encode("utf-8")))
+
+    response = get_solar_client().chat.completions.create(
+        model="solar-pro",
+        messages=[{"role": "user", "content": prompt}],
+        stream=False
+    )
+    current_span().add_usage(response.usage)
+
+    scores = parse_batch_scores(response.choices[0].message.content, [item["id"] for item in items])
+    if len(scores) < len(items):
+        current_span().fail()
+    return scores
+
+def score_short_answers(items, batch_size=SCORE_BATCH_SIZE, max_concurrency=MAX_CONCURRENT_SCORE_BATCHES):
+    """Scores items in concurrent batches, falling back to solar_score() per missing item."""
+    def score_batch(batch):
+        try:
+            return solar_score_batch(batch)
+        except Exception as e:
+            print(f"Batch scoring failed, scoring {len(batch)} items one by one: {e}")
+            return {}
+
+    batches = [items[i:i + batch_size] for i in range(0, len(items), batch_size)]
+    scores = {}
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        for batch_scores in executor.map(score_batch, batches):
+            scores.update(batch_scores)
+
+        leftovers = [item for item in items if item["id"] not in scores]
+        fallback = executor.map(lambda item: solar_score(item["student"], item["expected"]), leftovers)
+        for item, score in zip(leftovers, fallback):
+            scores[item["id"]] = score
+    return scores
+
+def grade_question(student_ans, correct_ans, qtype="short", stats=None):
     if student_ans is None or student_ans == "" or correct_ans is None or correct_ans == "":
+        if qtype == "short" and stats is not None:
+            stats.record_local("empty")
         return 0.0, "No answer provided"
 
     if qtype == "short":
+        local = pregrade(student_ans, correct_ans)
+        if local is not None:
+            score, rule, feedback = local
+            if stats is not None:
+                stats.record_local(rule)
+            return score, feedback
+        if stats is not None:
+            stats.record_escalated()
         score = solar_score(student_ans, correct_ans)
         return score, f"{int(score * 100)}% similarity (via Solar AI)"
 
@@ -130,7 +275,7 @@ def grade_question(student_ans, correct_ans, qtype="short"):
         correct = student_ans.strip().upper() == correct_ans.strip().upper()
         return (1.0 if correct else 0.0), "Multiple choice"
 
-    elif qtype == "truefalse":
+    elif qtype in ("truefalse", "tf"):  # detect_type() returns "tf"
         correct = student_ans.strip().lower() == correct_ans.strip().lower()
         return (1.0 if correct else 0.0), "True/False"
 
@@ -144,18 +289,89 @@ def grade_question(student_ans, correct_ans, qtype="short"):
     else:
         return 0.0, "Unsupported question type"
 
-def grade_exam(student_answers, model_answers):
+def score_with_memo(items, memo, batch_size, stats):
+    """
+    Scores items through a job-wide ScoreMemo: only answers no other student
+    has given are sent to the LLM, the rest reuse their cluster's score.
+    """
+    owned, waiting = [], []
+    for item in items:
+        future, owner = memo.claim(item["question_number"], item["expected"], item["student"])
+        (owned if owner else waiting).append((item, future))
+
+    scores = {}
+    if owned:
+        stats.record_escalated(len(owned))
+        try:
+            new_scores = score_short_answers([item for item, _ in owned], batch_size)
+        except Exception as e:
+            for _, future in owned:
+                memo.abandon(future, e)
+            raise
+        # Resolve before waiting on others, so two exams never wait on each other.
+        for item, future in owned:
+            memo.resolve(future, new_scores[item["id"]])
+            scores[item["id"]] = new_scores[item["id"]]
+
+    for item, future in waiting:
+        try:
+            scores[item["id"]] = future.result()
+            stats.record_local("cluster")
+        except Exception:
+            # The student who owned the cluster failed; score this answer alone.
+            stats.record_escalated()
+            scores[item["id"]] = solar_score(item["student"], item["expected"])
+    return scores
+
+def grade_exam(student_answers, model_answers, batch_size=SCORE_BATCH_SIZE, stats=None, memo=None):
+    """
+    Grades every answer. Short answers the pre-grader settles locally never
+    reach the LLM; with batch_size > 1 the rest are scored in batched prompts
+    up front, batch_size=1 scores them one call at a time.
+    stats: optional PregradeStats filled with this exam's local/LLM counts.
+    memo: optional ScoreMemo shared by a grading job, so an answer several
+    students gave is scored once (requires batch_size > 1).
+    """
+    stats = stats if stats is not None else PregradeStats()
+    exam_stats = PregradeStats()
+    short_scores = {}
+    if batch_size > 1:
+        items = []
+        for idx, student in enumerate(student_answers):
+            model = model_answers.get(student["question_number"], {})
+            if model.get("type", "short") == "short" and student["answer"] and model.get("answer"):
+                local = pregrade(student["answer"], model["answer"])
+                if local is not None:
+                    continue
+                items.append({
+                    "id": idx + 1,
+                    "question_number": student["question_number"],
+                    "question": student.get("question", ""),
+                    "expected": model["answer"],
+                    "student": student["answer"]
+                })
+        if items and memo is not None:
+            short_scores = score_with_memo(items, memo, batch_size, exam_stats)
+        elif items:
+            exam_stats.record_escalated(len(items))
+            short_scores = score_short_answers(items, batch_size)
+
     graded = []
-    for student in student_answers:
+    for idx, student in enumerate(student_answers):
         q_num = student["question_number"]
         stu_ans = student["answer"]
         model = model_answers.get(q_num, {})
         correct = model.get("answer")
         q_type = model.get("type", "short")
 
-        score, feedback = grade_question(stu_ans, correct, q_type)
+        if idx + 1 in short_scores:
+            score = short_scores[idx + 1]
+            feedback = f"{int(score * 100)}% similarity (via Solar AI)"
+        else:
+            score, feedback = grade_question(stu_ans, correct, q_type, stats=exam_stats)
 
         result = {
+            "question_number": q_num,
             "question": student["question"],
             "student_answer": stu_ans,
             "expected_answer": correct,
@@ -166,21 +382,29 @@ def grade_exam(student_answers, model_answers):
             result["feedback"] = feedback
 
         graded.append(result)
+
+    stats.merge(exam_stats)
+    PREGRADE_TOTALS.merge(exam_stats)
     return graded
 
 
-# ---- Wrapper Function ---- #
-def run_exam_grading(student_image_path, model_answer_file):
-    with open(student_image_path, "rb") as f:
+# ---- Wrapper Functions ---- #
+def compile_answer_key(model_answer_file):
+    """Returns the stored answer-key artifact for a PDF (path or StoredUpload), parsing it only once."""
+    return ANSWER_KEY_STORE.compile(model_answer_file, extract_answers_from_pdf)
+
+def grade_student_paper(student_image_path, answer_key, stats=None, memo=None):
+    """
+    Grades one student paper against a compiled answer key: OCR plus scoring
+    only. Pass the same ScoreMemo for every student of a class.
+    """
+    with open_document(student_image_path) as f:
         ocr_result = ocr_image(f)
     student_text = ocr_result.get("text", "").strip()
     student_answers = extract_answers_from_context_with_solar(student_text)
 
-    model_answer_list = extract_answers_from_pdf(model_answer_file)
-
-    model_answers = {
-        item["question"]: {"answer": item["answer"], "type": item["type"]}
-        for item in model_answer_list
-    }
+    return grade_exam(student_answers, model_answers_from(answer_key), stats=stats, memo=memo)
 
-    return grade_exam(student_answers, model_answers)
+def run_exam_grading(student_image_path, model_answer_file, stats=None):
+    """Both file arguments may be file paths or StoredUploads; stats as in grade_exam."""
+    return grade_student_paper(student_image_path, compile_answer_key(model_answer_file), stats)
@@ -1,20 +1,212 @@
-from fastapi import FastAPI, File, UploadFile
-from fastapi.responses import JSONResponse
-import shutil
-from exam_grader import run_exam_grading
+from fastapi import FastAPI, File, UploadFile, Form
+from fastapi.responses import JSONResponse, PlainTextResponse
+from typing import List, Optional
+from fastapi.concurrency import run_in_threadpool
+from exam_grader import compile_answer_key, grade_student_paper, warm_up
+from answer_keys import ANSWER_KEY_STORE, model_answers_from
+from class_matrix import grade_class
+from uploads import UploadSession, SessionStreamingResponse
+from disk_cache import PARSE_CACHE
+from metrics import METRICS
+from pregrader import PregradeStats, PREGRADE_TOTALS
+from score_memo import ScoreMemo
+import os
+import json
+import asyncio
+
+# Students graded at the same time by /grade_batch; each one holds an OCR
+# call, an extraction call and its own scoring batches.
+GRADE_BATCH_WORKERS = int(os.getenv("GRADE_BATCH_WORKERS", "4"))
 
 app = FastAPI()
 
+@app.on_event("startup")
+async def startup():
+    warm_up()
+
+for _field in ("hits", "misses", "entries", "bytes"):
+    METRICS.register_gauge(
+        f"disk_cache_{_field}", f"Disk cache {_field}.",
+        lambda field=_field: {"parse": PARSE_CACHE.stats()[field]},
+        label="cache"
+    )
+METRICS.register_counter("pregrade_local_total", "Short answers graded locally without an LLM call, by rule.",
+                         lambda: PREGRADE_TOTALS.as_dict()["by_rule"], label="rule")
+METRICS.register_counter("pregrade_escalated_total", "Short answers sent to the LLM for scoring.",
+                         lambda: PREGRADE_TOTALS.as_dict()["sent_to_llm"])
+
+def answer_key_summary(artifact):
+    return {
+        "answer_key_id": artifact["answer_key_id"],
+        "version": artifact["version"],
+        "source_filename": artifact["source_filename"],
+        "questions": len(artifact["answers"])
+    }
+
+@app.post("/answer_keys", status_code=201)
+async def create_answer_key(answer_key: UploadFile = File(...)):
+    """Compiles an answer key once; grade against it with answer_key_id."""
+    async with UploadSession() as session:
+        try:
+            key = await session.add(answer_key)
+            artifact = await run_in_threadpool(compile_answer_key, key)
+        except Exception as e:
+            return JSONResponse(content={"error": str(e)}, status_code=500)
+    return JSONResponse(content=answer_key_summary(artifact), status_code=201)
+
+@app.get("/answer_keys/{answer_key_id}")
+async def get_answer_key(answer_key_id: str):
+    artifact = await run_in_threadpool(ANSWER_KEY_STORE.get, answer_key_id)
+    if artifact is None:
+        return JSONResponse(content={"error": "Unknown answer key"}, status_code=404)
+    return JSONResponse(content=artifact)
+
+@app.delete("/answer_keys/{answer_key_id}")
+async def delete_answer_key(answer_key_id: str):
+    if not await run_in_threadpool(ANSWER_KEY_STORE.delete, answer_key_id):
+        return JSONResponse(content={"error": "Unknown answer key"}, status_code=404)
+    return JSONResponse(content={"deleted": answer_key_id})
+
+async def resolve_answer_key(session, answer_key, answer_key_id):
+    """Returns (artifact, None), or (None, error response) if the key is missing."""
+    if answer_key is None and not answer_key_id:
+        return None, JSONResponse(content={"error": "Send answer_key or answer_key_id"}, status_code=400)
+    if answer_key_id:
+        artifact = await run_in_threadpool(ANSWER_KEY_STORE.get, answer_key_id)
+        if artifact is None:
+            return None, JSONResponse(content={"error": "Unknown answer key"}, status_code=404)
+        return artifact, None
+    key = await session.add(answer_key)
+    return await run_in_threadpool(compile_answer_key, key), None
+
 @app.post("/grade")
-async def grade_exam(student_file: UploadFile = File(...), answer_key: UploadFile = File(...)):
-    with open("student.jpg", "wb") as f:
-        shutil.copyfileobj(student_file.file, f)
+async def grade_exam(
+    student_file: UploadFile = File(...),
+    answer_key: Optional[UploadFile] = File(None),
+    answer_key_id: Optional[str] = Form(None)  # id returned by POST /answer_keys
+):
+    # Each request gets its own upload storage, so concurrent gradings never
+    # overwrite each other's files, and nothing is left on disk afterwards.
+    async with UploadSession() as session:
+        try:
+            # A key uploaded with the paper is compiled (or found) by hash too.
+            artifact, error = await resolve_answer_key(session, answer_key, answer_key_id)
+            if error is not None:
+                return error
 
-    with open("answer_key.pdf", "wb") as f:
-        shutil.copyfileobj(answer_key.file, f)
+            student = await session.add(student_file)
+            stats = PregradeStats()
+            result = await run_in_threadpool(grade_student_paper, student, artifact, stats)
+            counts = stats.as_dict()
+            # Per-exam counters go in headers so the response body stays a plain list.
+            return JSONResponse(content=result, headers={
+                "X-Answer-Key-Id": artifact["answer_key_id"],
+                "X-Short-Answers": str(counts["short_answers"]),
+                "X-Graded-Locally": str(counts["graded_locally"]),
+                "X-Sent-To-LLM": str(counts["sent_to_llm"])
+            })
+        except Exception as e:
+            return JSONResponse(content={"error": str(e)}, status_code=500)
 
+@app.post("/grade_batch")
+async def grade_batch(
+    student_files: List[UploadFile] = File(...),  # papers, or .zip archives of papers
+    answer_key: Optional[UploadFile] = File(None),
+    answer_key_id: Optional[str] = Form(None)
+):
+    """
+    Grades a whole class against one answer key, compiled once. Students are
+    graded GRADE_BATCH_WORKERS at a time and streamed back as NDJSON in the
+    order they finish: one "student" event each (with "result" or "error"),
+    then a "statistics" event with item statistics of the objective
+    questions over all graded students, then a "complete" event.
+    """
+    session = UploadSession()
     try:
-        result = run_exam_grading("student.jpg", "answer_key.pdf")
-        return JSONResponse(content=result)
+        artifact, error = await resolve_answer_key(session, answer_key, answer_key_id)
+        if error is not None:
+            session.cleanup()
+            return error
+        students = []
+        for upload in student_files:
+            if (upload.filename or "").lower().endswith(".zip"):
+                students.extend(await session.add_zip(upload))
+            else:
+                students.append(await session.add(upload))
+    except ValueError as e:
+        session.cleanup()
+        return JSONResponse(content={"error": str(e)}, status_code=400)
     except Exception as e:
+        session.cleanup()
         return JSONResponse(content={"error": str(e)}, status_code=500)
+
+    semaphore = asyncio.Semaphore(GRADE_BATCH_WORKERS)
+    # Lives as long as this job: each distinct answer is scored by the LLM once.
+    memo = ScoreMemo()
+
+    async def grade_one(index, student):
+        event = {"event": "student", "index": index, "filename": student.filename}
+        async with semaphore:
+            stats = PregradeStats()
+            try:
+                result = await run_in_threadpool(grade_student_paper, student, artifact, stats, memo)
+            except Exception as e:
+                # Only this student fails; the rest of the class keeps grading.
+                event["error"] = str(e)
+                return event
+        counts = stats.as_dict()
+        event.update({
+            "result": result,
+            "score": sum(question["score"] for question in result),
+            "short_answers": counts["short_answers"],
+            "graded_locally": counts["graded_locally"],
+            "sent_to_llm": counts["sent_to_llm"]
+        })
+        return event
+
+    async def event_stream():
+        tasks = [asyncio.create_task(grade_one(i, student)) for i, student in enumerate(students)]
+        failed = 0
+        answers = {}
+        try:
+            for finished in asyncio.as_completed(tasks):
+                event = await finished
+                if "error" in event:
+                    failed += 1
+                else:
+                    answers[event["index"]] = [
+                        {"question_number": item["question_number"], "answer": item["student_answer"]}
+                        for item in event["result"]
+                    ]
+                yield json.dumps(event, ensure_ascii=False) + "\n"
+
+            grades = await run_in_threadpool(
+                grade_class, [answers[i] for i in sorted(answers)], model_answers_from(artifact)
+            )
+            yield json.dumps({
+                "event": "statistics",
+                "students": len(answers),
+                "items": grades.item_statistics()
+            }, ensure_ascii=False) + "\n"
+            yield json.dumps({
+                "event": "complete",
+                "answer_key_id": artifact["answer_key_id"],
+                "students": len(students),
+                "graded": len(students) - failed,
+                "failed": failed,
+                **memo.as_dict()
+            }) + "\n"
+        finally:
+            # On client disconnect, students still waiting for a worker are dropped.
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    # Disable proxy buffering so results reach the client as they finish.
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    # The response cleans up the session, even if the body is never iterated.
+    return SessionStreamingResponse(session, event_stream(), media_type="application/x-ndjson", headers=headers)
+
+@app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(METRICS.render(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,197 @@
+import json
+import time
+import logging
+import threading
+import functools
+import contextvars
+from contextlib import contextmanager
+from inspect import iscoroutinefunction
+
+# ---- Pipeline spans and Prometheus metrics ---- #
+# Shared by the generator and grader services. Every pipeline stage and
+# external call runs inside a span that records its latency, payload size and
+# prompt/completion tokens. Finished spans are logged as one JSON line on the
+# "pipeline.spans" logger and added to process-wide totals that /metrics
+# renders in the Prometheus text format.
+
+SPAN_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+span_logger = logging.getLogger("pipeline.spans")
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    def __init__(self, name):
+        self.name = name
+        self.status = "ok"
+        self.payload_bytes = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    def add_payload(self, size):
+        self.payload_bytes += size
+
+    def add_usage(self, usage):
+        """Adds the token counts of an OpenAI-style usage object, if present."""
+        if usage is None:
+            return
+        self.prompt_tokens += getattr(usage, "prompt_tokens", 0) or 0
+        self.completion_tokens += getattr(usage, "completion_tokens", 0) or 0
+
+    def fail(self):
+        self.status = "error"
+
+
+class _NullSpan(Span):
+    """Stands in when no span is active, so callers never need to check."""
+
+    def __init__(self):
+        super().__init__("none")
+
+    def add_payload(self, size):
+        pass
+
+    def add_usage(self, usage):
+        pass
+
+    def fail(self):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def current_span():
+    """Returns the innermost active span of this task or thread."""
+    return _current_span.get() or _NULL_SPAN
+
+
+class Metrics:
+    """Thread-safe span totals plus gauges and counters read at scrape time."""
+
+    def __init__(self, buckets=SPAN_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._spans = {}
+        self._readings = []  # (name, help text, read, label, Prometheus type)
+
+    def observe(self, span, seconds):
+        with self._lock:
+            totals = self._spans.get(span.name)
+            if totals is None:
+                totals = self._spans[span.name] = {
+                    "calls": {}, "seconds": 0.0, "buckets": [0] * len(self.buckets),
+                    "payload_bytes": 0, "prompt_tokens": 0, "completion_tokens": 0,
+                }
+            totals["calls"][span.status] = totals["calls"].get(span.status, 0) + 1
+            totals["seconds"] += seconds
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    totals["buckets"][i] += 1
+            totals["payload_bytes"] += span.payload_bytes
+            totals["prompt_tokens"] += span.prompt_tokens
+            totals["completion_tokens"] += span.completion_tokens
+
+    def register_gauge(self, name, help_text, read, label="name"):
+        """read() returns a number, or a dict of {label value: number}."""
+        self._readings.append((name, help_text, read, label, "gauge"))
+
+    def register_counter(self, name, help_text, read, label="name"):
+        """Like register_gauge(), for totals that only ever grow."""
+        self._readings.append((name, help_text, read, label, "counter"))
+
+    def render(self):
+        """Returns all metrics in the Prometheus text exposition format."""
+        with self._lock:
+            spans = {name: {**t, "calls": dict(t["calls"]), "buckets": list(t["buckets"])}
+                     for name, t in sorted(self._spans.items())}
+
+        lines = [
+            "# HELP pipeline_span_calls_total Finished spans by outcome.",
+            "# TYPE pipeline_span_calls_total counter",
+        ]
+        for name, t in spans.items():
+            for status, count in sorted(t["calls"].items()):
+                lines.append(f'pipeline_span_calls_total{{span="{name}",status="{status}"}} {count}')
+
+        lines += [
+            "# HELP pipeline_span_duration_seconds Span latency.",
+            "# TYPE pipeline_span_duration_seconds histogram",
+        ]
+        for name, t in spans.items():
+            for bound, count in zip(self.buckets, t["buckets"]):
+                lines.append(f'pipeline_span_duration_seconds_bucket{{span="{name}",le="{bound}"}} {count}')
+            total = sum(t["calls"].values())
+            lines.append(f'pipeline_span_duration_seconds_bucket{{span="{name}",le="+Inf"}} {total}')
+            lines.append(f'pipeline_span_duration_seconds_sum{{span="{name}"}} {t["seconds"]:.6f}')
+            lines.append(f'pipeline_span_duration_seconds_count{{span="{name}"}} {total}')
+
+        lines += [
+            "# HELP pipeline_span_payload_bytes_total Bytes sent upstream (documents or prompts).",
+            "# TYPE pipeline_span_payload_bytes_total counter",
+        ]
+        for name, t in spans.items():
+            lines.append(f'pipeline_span_payload_bytes_total{{span="{name}"}} {t["payload_bytes"]}')
+
+        lines += [
+            "# HELP pipeline_span_tokens_total LLM tokens reported by the API.",
+            "# TYPE pipeline_span_tokens_total counter",
+        ]
+        for name, t in spans.items():
+            lines.append(f'pipeline_span_tokens_total{{span="{name}",kind="prompt"}} {t["prompt_tokens"]}')
+            lines.append(f'pipeline_span_tokens_total{{span="{name}",kind="completion"}} {t["completion_tokens"]}')
+
+        for name, help_text, read, label, kind in self._readings:
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+            value = read()
+            if isinstance(value, dict):
+                for key, v in sorted(value.items()):
+                    lines.append(f'{name}{{{label}="{key}"}} {v}')
+            else:
+                lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+METRICS = Metrics()
+
+
+@contextmanager
+def span(name, metrics=METRICS):
+    """Times the enclosed block as a span named name; exceptions mark it failed."""
+    current = Span(name)
+    token = _current_span.set(current)
+    start = time.perf_counter()
+    try:
+        yield current
+    except BaseException:
+        current.fail()
+        raise
+    finally:
+        seconds = time.perf_counter() - start
+        _current_span.reset(token)
+        metrics.observe(current, seconds)
+        if span_logger.isEnabledFor(logging.INFO):
+            span_logger.info(json.dumps({
+                "span": name, "status": current.status, "seconds": round(seconds, 4),
+                "payload_bytes": current.payload_bytes,
+                "prompt_tokens": current.prompt_tokens,
+                "completion_tokens": current.completion_tokens,
+            }))
+
+
+def traced(name):
+    """Decorator running a sync or async function inside span(name)."""
+    def decorate(func):
+        if iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
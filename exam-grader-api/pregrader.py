@@ -0,0 +1,178 @@
+import re
+import threading
+import unicodedata
+
+# ---- Local pre-grading of short answers ---- #
+# Settles the cases that need no model: empty answers, exact matches after
+# normalization, answers that differ only in spacing, quotes or trailing
+# punctuation (OCR often turns "12" into "1 2"), numerically equal answers, and
+# long answers with the same words up to characters OCR commonly confuses
+# (rn/m, cl/d, l/1/I, 0/O, 5/S). Signs, decimal points and symbols such as +
+# or # are never ignored, and any other letter change ("isotopic" /
+# "isotonic", "absorption" / "adsorption") may change the meaning, so it is
+# left to the model. Everything else returns None and is escalated to Solar.
+
+MIN_FUZZY_LENGTH = 8
+FUZZY_ERROR_RATE = 0.1
+NUMERIC_TOLERANCE = 0.01
+
+_WHITESPACE = re.compile(r"\s+")
+_NUMBER = re.compile(r"[-+]?(?:\d+\.?\d*|\.\d+)(?:e[-+]?\d+)?")
+_THOUSANDS = re.compile(r"[-+]?\d{1,3}(?:,\d{3})+(?:\.\d*)?")
+# Characters that carry no meaning in an answer; everything else is kept.
+_IGNORABLE = re.compile(r"[\s'\"`\u2018\u2019\u201c\u201d]+")
+_TRAILING_PUNCTUATION = ".,;:!?"
+# Misreadings OCR commonly makes, mapped to one canonical spelling.
+_OCR_SEQUENCES = (("rn", "m"), ("cl", "d"))
+_OCR_CHARACTERS = str.maketrans({"1": "l", "i": "l", "0": "o", "5": "s"})
+
+
+def normalize(text):
+    """Unicode-normalized, lowercased, single-spaced text."""
+    text = unicodedata.normalize("NFKC", str(text)).lower()
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+def compact(text):
+    """Normalized text without whitespace, quotes or trailing sentence punctuation."""
+    return _IGNORABLE.sub("", normalize(text)).rstrip(_TRAILING_PUNCTUATION)
+
+
+def words(text):
+    """Normalized words, each without quotes or trailing sentence punctuation."""
+    return [w for w in (compact(word) for word in normalize(text).split()) if w]
+
+
+def parse_number(text):
+    """Returns the float an answer like "1,200", "12 %", "$ 3.5" or "1 2" stands for, or None."""
+    cleaned = normalize(text).replace(" ", "").strip("$%")
+    # Commas only as thousands separators; "1,5" may be a decimal comma.
+    if "," in cleaned and not _THOUSANDS.fullmatch(cleaned):
+        return None
+    cleaned = cleaned.replace(",", "")
+    if not _NUMBER.fullmatch(cleaned):
+        return None
+    try:
+        return float(cleaned)
+    except ValueError:
+        return None
+
+
+def within_edit_distance(a, b, limit):
+    """True if the Levenshtein distance of a and b is at most limit (banded, early exit)."""
+    if abs(len(a) - len(b)) > limit:
+        return False
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, start=1):
+        current = [i] + [limit + 1] * len(b)
+        low, high = max(1, i - limit), min(len(b), i + limit)
+        for j in range(low, high + 1):
+            current[j] = min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (ca != b[j - 1])
+            )
+        if min(current[max(0, low - 1):high + 1]) > limit:
+            return False
+        previous = current
+    return previous[len(b)] <= limit
+
+
+def ocr_canonical(word):
+    """Spells a normalized word with every commonly confused OCR reading made the same."""
+    for sequence, replacement in _OCR_SEQUENCES:
+        word = word.replace(sequence, replacement)
+    return word.translate(_OCR_CHARACTERS)
+
+
+def is_ocr_slip(a_word, b_word):
+    """True if two different words differ only in characters OCR commonly confuses."""
+    if not (a_word.isalnum() and b_word.isalnum()):
+        # Signs, decimal points and symbols change meaning.
+        return False
+    if a_word.isdigit() and b_word.isdigit():
+        # Two readings of a number are never confused with each other.
+        return False
+    return ocr_canonical(a_word) == ocr_canonical(b_word)
+
+
+def near_duplicate(answer, reference):
+    """
+    True if a long answer has the same words as the reference and the
+    differing ones are OCR misreadings, within a small total edit distance.
+    """
+    answer_words, reference_words = words(answer), words(reference)
+    if len(answer_words) != len(reference_words):
+        return False
+    answer_compact, reference_compact = "".join(answer_words), "".join(reference_words)
+    if len(reference_compact) < MIN_FUZZY_LENGTH:
+        return False
+    for a_word, b_word in zip(answer_words, reference_words):
+        if a_word != b_word and not is_ocr_slip(a_word, b_word):
+            return False
+    limit = max(1, int(len(reference_compact) * FUZZY_ERROR_RATE))
+    return within_edit_distance(answer_compact, reference_compact, limit)
+
+
+def pregrade(student_ans, correct_ans):
+    """
+    Returns (score, rule, feedback) when the answer can be graded locally
+    with confidence, or None when it needs the LLM.
+    """
+    if student_ans is None or not str(student_ans).strip():
+        return 0.0, "empty", "No answer provided"
+
+    if normalize(student_ans) == normalize(correct_ans):
+        return 1.0, "exact", "Exact match (graded locally)"
+
+    student_compact, correct_compact = compact(student_ans), compact(correct_ans)
+    if student_compact and student_compact == correct_compact:
+        return 1.0, "spacing", "Matches ignoring spacing and quotes (graded locally)"
+
+    student_number, correct_number = parse_number(student_ans), parse_number(correct_ans)
+    if student_number is not None and correct_number is not None:
+        if abs(student_number - correct_number) <= NUMERIC_TOLERANCE:
+            return 1.0, "numeric", "Numerically equivalent (graded locally)"
+        return 0.0, "numeric", "Numerically different (graded locally)"
+
+    if near_duplicate(student_ans, correct_ans):
+        return 1.0, "edit_distance", "Matches up to minor OCR errors (graded locally)"
+
+    return None
+
+
+class PregradeStats:
+    """Counts short answers graded locally (by rule) versus sent to the LLM."""
+
+    def __init__(self):
+        self.local = {}
+        self.escalated = 0
+        self._lock = threading.Lock()
+
+    def record_local(self, rule):
+        with self._lock:
+            self.local[rule] = self.local.get(rule, 0) + 1
+
+    def record_escalated(self, count=1):
+        with self._lock:
+            self.escalated += count
+
+    def merge(self, other):
+        with self._lock:
+            for rule, count in other.local.items():
+                self.local[rule] = self.local.get(rule, 0) + count
+            self.escalated += other.escalated
+
+    def as_dict(self):
+        with self._lock:
+            graded_locally = sum(self.local.values())
+            return {
+                "short_answers": graded_locally + self.escalated,
+                "graded_locally": graded_locally,
+                "sent_to_llm": self.escalated,
+                "by_rule": dict(self.local),
+            }
+
+
+# Process-wide totals, exported at /metrics.
+PREGRADE_TOTALS = PregradeStats()
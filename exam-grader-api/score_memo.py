@@ -0,0 +1,71 @@
+import threading
+from concurrent.futures import Future
+from pregrader import normalize, compact, near_duplicate
+
+# ---- Cross-student score memo ---- #
+# Within one grading job, many students give the same short answer. Answers
+# to a question are clustered (exact match after normalization first, then
+# near-duplicates of a cluster's first answer by the pre-grader's rules, so
+# answers differing in a sign, decimal point or negation never share a score)
+# and each cluster is scored by the LLM once; every other member reuses that
+# score. Clusters are futures, so a student whose answer is already being
+# scored by another worker waits for that result instead of sending a second
+# request.
+
+
+class ScoreMemo:
+    """Short-answer scores shared by every student of one grading job."""
+
+    def __init__(self):
+        self._exact = {}            # (question key, answer key) -> Future
+        self._representatives = {}  # question key -> [(answer text, Future)]
+        self._keys = {}             # Future -> every (question key, answer key) mapped to it
+        self._lock = threading.Lock()
+        self.clusters = 0
+        self.reused = 0
+
+    def claim(self, question, expected, student_ans):
+        """
+        Returns (future, owner). The owner must score the answer and call
+        resolve() or abandon(); everyone else waits on future.result().
+        """
+        question_key = (question, compact(expected))
+        answer_key = compact(student_ans) or normalize(student_ans)
+        with self._lock:
+            future = self._exact.get((question_key, answer_key))
+            if future is None:
+                for representative, candidate in self._representatives.get(question_key, []):
+                    if near_duplicate(student_ans, representative):
+                        future = candidate
+                        self._exact[(question_key, answer_key)] = candidate
+                        self._keys[candidate].append((question_key, answer_key))
+                        break
+            if future is not None:
+                self.reused += 1
+                return future, False
+
+            future = Future()
+            self._keys[future] = [(question_key, answer_key)]
+            self._exact[(question_key, answer_key)] = future
+            self._representatives.setdefault(question_key, []).append((normalize(student_ans), future))
+            self.clusters += 1
+            return future, True
+
+    def resolve(self, future, score):
+        future.set_result(score)
+
+    def abandon(self, future, error):
+        """Fails waiting members and forgets the cluster, so the answer is scored again later."""
+        with self._lock:
+            for question_key, answer_key in self._keys.pop(future, []):
+                self._exact.pop((question_key, answer_key), None)
+                representatives = self._representatives.get(question_key, [])
+                self._representatives[question_key] = [
+                    entry for entry in representatives if entry[1] is not future
+                ]
+            self.clusters -= 1
+        future.set_exception(error)
+
+    def as_dict(self):
+        with self._lock:
+            return {"distinct_answers_scored": self.clusters, "answers_reused": self.reused}
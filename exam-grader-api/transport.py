@@ -0,0 +1,222 @@
+import os
+import time
+import random
+import asyncio
+import threading
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+# ---- Shared HTTP transport for Upstage calls ---- #
+# Shared by the generator and grader services. Document-parse and OCR posts go
+# through one keep-alive connection pool with per-call timeouts, are retried
+# with jittered exponential backoff on 429/5xx and connection errors, and fail
+# fast while a circuit breaker is open after repeated failures. The
+# OpenAI-compatible clients get the same pool limits and timeouts.
+
+UPSTAGE_BASE_URL = os.getenv("UPSTAGE_BASE_URL", "https://api.upstage.ai/v1")
+
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "20"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "10"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "120"))
+HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "3"))
+HTTP_BACKOFF_BASE = float(os.getenv("HTTP_BACKOFF_BASE", "0.5"))
+HTTP_BACKOFF_MAX = float(os.getenv("HTTP_BACKOFF_MAX", "30"))
+
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RESET_SECONDS = float(os.getenv("BREAKER_RESET_SECONDS", "30"))
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(requests.RequestException):
+    """Raised without calling the upstream while its circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Opens after failure_threshold consecutive failed calls and rejects calls
+    for reset_seconds. After that a single trial call is let through: success
+    closes the breaker, failure opens it again.
+    """
+
+    def __init__(self, failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_seconds=BREAKER_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._failures = 0
+        self._opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.monotonic() - self._opened_at >= self.reset_seconds:
+                return "half-open"
+            return "open"
+
+    def before_call(self):
+        """
+        Raises CircuitOpenError if the call must not be made. Returns True if
+        the call is the half-open trial, which must end in record_success(),
+        record_failure() or release_trial().
+        """
+        with self._lock:
+            if self._opened_at is None:
+                return False
+            if time.monotonic() - self._opened_at < self.reset_seconds or self._trial_running:
+                raise CircuitOpenError("Upstream temporarily unavailable (circuit open)")
+            self._trial_running = True
+            return True
+
+    def release_trial(self):
+        """Ends a trial that was cancelled or failed for a local reason, so another can start."""
+        with self._lock:
+            self._trial_running = False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_running or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+            self._trial_running = False
+
+
+UPSTAGE_BREAKER = CircuitBreaker()
+
+
+def backoff_delay(attempt, retry_after=None):
+    """Full-jitter exponential backoff; a numeric Retry-After header wins."""
+    if retry_after is not None:
+        try:
+            return min(float(retry_after), HTTP_BACKOFF_MAX)
+        except ValueError:
+            pass
+    return random.uniform(0, min(HTTP_BACKOFF_MAX, HTTP_BACKOFF_BASE * 2 ** attempt))
+
+
+def _new_session():
+    session = requests.Session()
+    # Retries are handled in post_with_retry so they share the breaker.
+    adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE, max_retries=0)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+session = _new_session()
+
+
+def post_with_retry(url, retries=HTTP_MAX_RETRIES, timeout=HTTP_READ_TIMEOUT, breaker=UPSTAGE_BREAKER, **kwargs):
+    """
+    POSTs through the shared session and returns the response, raising
+    requests.RequestException once retries are exhausted. Request bodies must
+    be bytes or re-readable, since a retry sends them again.
+    """
+    for attempt in range(retries + 1):
+        trial = breaker.before_call()
+        try:
+            response = session.post(url, timeout=(HTTP_CONNECT_TIMEOUT, timeout), **kwargs)
+        except (requests.ConnectionError, requests.Timeout):
+            breaker.record_failure()
+            if attempt == retries:
+                raise
+            time.sleep(backoff_delay(attempt))
+            continue
+        except requests.RequestException:
+            # e.g. ChunkedEncodingError: upstream answered, but badly.
+            breaker.record_failure()
+            raise
+        except BaseException:
+            # Interrupted or failed locally; says nothing about upstream health.
+            if trial:
+                breaker.release_trial()
+            raise
+
+        if response.status_code not in RETRY_STATUS_CODES:
+            breaker.record_success()
+            response.raise_for_status()
+            return response
+
+        breaker.record_failure()
+        if attempt == retries:
+            response.raise_for_status()
+        time.sleep(backoff_delay(attempt, response.headers.get("Retry-After")))
+
+
+def http_limits():
+    return httpx.Limits(max_connections=HTTP_POOL_SIZE, max_keepalive_connections=HTTP_POOL_SIZE)
+
+
+def http_timeout(read_timeout=HTTP_READ_TIMEOUT):
+    return httpx.Timeout(read_timeout, connect=HTTP_CONNECT_TIMEOUT)
+
+
+async def async_post_with_retry(client, url, retries=HTTP_MAX_RETRIES, limiter=None,
+                                breaker=UPSTAGE_BREAKER, **kwargs):
+    """
+    httpx.AsyncClient counterpart of post_with_retry. limiter, if given, is an
+    asyncio.Semaphore held during each attempt but not while backing off.
+    """
+    for attempt in range(retries + 1):
+        trial = breaker.before_call()
+        try:
+            if limiter is not None:
+                async with limiter:
+                    response = await client.post(url, **kwargs)
+            else:
+                response = await client.post(url, **kwargs)
+        except httpx.TransportError:
+            breaker.record_failure()
+            if attempt == retries:
+                raise
+            await asyncio.sleep(backoff_delay(attempt))
+            continue
+        except httpx.HTTPError:
+            breaker.record_failure()
+            raise
+        except BaseException:
+            # Cancelled (client disconnect, stopped job) or failed locally.
+            if trial:
+                breaker.release_trial()
+            raise
+
+        if response.status_code not in RETRY_STATUS_CODES:
+            breaker.record_success()
+            response.raise_for_status()
+            return response
+
+        breaker.record_failure()
+        if attempt == retries:
+            response.raise_for_status()
+        await asyncio.sleep(backoff_delay(attempt, response.headers.get("Retry-After")))
+
+
+def openai_client(api_key=None):
+    """OpenAI-compatible Upstage client on a pooled httpx client; the SDK retries 429/5xx itself."""
+    # Imported here: the openai package alone takes ~0.5s to import.
+    from openai import OpenAI
+    return OpenAI(
+        api_key=api_key or os.getenv("UPSTAGE_API_KEY"),
+        base_url=UPSTAGE_BASE_URL,
+        max_retries=HTTP_MAX_RETRIES,
+        http_client=httpx.Client(limits=http_limits(), timeout=http_timeout())
+    )
+
+
+def async_openai_client(api_key=None):
+    from openai import AsyncOpenAI
+    return AsyncOpenAI(
+        api_key=api_key or os.getenv("UPSTAGE_API_KEY"),
+        base_url=UPSTAGE_BASE_URL,
+        max_retries=HTTP_MAX_RETRIES,
+        http_client=httpx.AsyncClient(limits=http_limits(), timeout=http_timeout())
+    )
@@ -127,7 +127,7 @@ def grade_question(student_ans, correct_ans, qtype="short"):
         correct = student_ans.strip().upper() == correct_ans.strip().upper()
         return (1.0 if correct else 0.0), "Multiple choice"
 
-    elif qtype == "truefalse":
+    elif qtype in ("truefalse", "tf"):  # detect_type() returns "tf"
         correct = student_ans.strip().lower() == correct_ans.strip().lower()
         return (1.0 if correct else 0.0), "True/False"
 
@@ -1,29 +1,93 @@
-
-from sentence_transformers import SentenceTransformer, util
-from transformers import pipeline
-from rake_nltk import Rake
-import torch
-
-model = SentenceTransformer('princeton-nlp/sup-simcse-bert-base-uncased')
-
-nli_pipeline = pipeline("text-classification", model="roberta-large-mnli")
+import os
+import threading
+from embedding_cache import EMBEDDING_CACHE
+
+# ---- Lazily loaded models ---- #
+# Importing this module is cheap: torch, transformers and the model weights
+# are loaded on first use, or up front by warm_up(). Calling warm_up() in a
+# parent process before it forks workers (e.g. gunicorn --preload) lets every
+# worker share the loaded weights copy-on-write instead of loading its own.
+
+EMBEDDING_MODEL_NAME = os.getenv("GRADER_EMBEDDING_MODEL", "princeton-nlp/sup-simcse-bert-base-uncased")
+NLI_MODEL_NAME = os.getenv("GRADER_NLI_MODEL", "roberta-large-mnli")
+
+_model = None
+_nli_pipeline = None
+_model_lock = threading.Lock()
+
+def get_model():
+    """Returns the sentence embedding model, loading it on first use."""
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                from sentence_transformers import SentenceTransformer
+                _model = SentenceTransformer(EMBEDDING_MODEL_NAME)
+                _model.eval()
+    return _model
+
+def get_nli_pipeline():
+    """Returns the NLI text-classification pipeline, loading it on first use."""
+    global _nli_pipeline
+    if _nli_pipeline is None:
+        with _model_lock:
+            if _nli_pipeline is None:
+                from transformers import pipeline
+                _nli_pipeline = pipeline("text-classification", model=NLI_MODEL_NAME)
+    return _nli_pipeline
+
+def warm_up():
+    """Loads both models now instead of on the first graded answer."""
+    get_model()
+    get_nli_pipeline()
+
+def encode_cached(texts):
+    """
+    Embeds reference-side texts (model answers, keywords) as one stacked
+    tensor. Texts already in EMBEDDING_CACHE are not re-encoded; the rest
+    are encoded together in one batch.
+    """
+    import torch
+    model = get_model()
+    kind = f"embedding:{EMBEDDING_MODEL_NAME}"
+    embeddings = [EMBEDDING_CACHE.get(kind, text) for text in texts]
+    missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+    if missing:
+        encoded = model.encode([texts[i] for i in missing], convert_to_tensor=True)
+        for i, embedding in zip(missing, encoded):
+            # Cloned so the cached row does not keep the whole batch tensor alive.
+            embedding = embedding.clone()
+            EMBEDDING_CACHE.put(kind, texts[i], embedding)
+            embeddings[i] = embedding
+    return torch.stack([embedding.to(model.device) for embedding in embeddings])
 
 def get_similarity(student_ans, correct_ans):
-    embeddings = model.encode([student_ans, correct_ans], convert_to_tensor=True)
-    return util.pytorch_cos_sim(embeddings[0], embeddings[1]).item()
+    from sentence_transformers import util
+    student_embedding = get_model().encode(student_ans, convert_to_tensor=True)
+    correct_embedding = encode_cached([correct_ans])[0]
+    return util.pytorch_cos_sim(student_embedding, correct_embedding).item()
 
 def contradiction_check(student_ans, correct_ans):
     input_text = student_ans.strip() + " </s></s> " + correct_ans.strip()
-    result = nli_pipeline(input_text)[0]
+    result = get_nli_pipeline()(input_text)[0]
     return result['label']
 
 def extract_keywords(text):
-    rake = Rake()
-    rake.extract_keywords_from_text(text)
-    return [phrase.lower() for phrase in rake.get_ranked_phrases()]
+    """RAKE keywords of a reference answer, computed once per distinct text."""
+    def rake_keywords(normalized):
+        from rake_nltk import Rake
+        rake = Rake()
+        rake.extract_keywords_from_text(normalized)
+        return [phrase.lower() for phrase in rake.get_ranked_phrases()]
+    return list(EMBEDDING_CACHE.get_or_compute("keywords", text, rake_keywords))
 
 def keyword_match(student_ans, rake_keywords, threshold=0.7):
-    matched = []
+    """
+    Returns the keywords that some bigram or trigram of the answer is at least
+    threshold similar to. Windows and keywords are each encoded in one batch
+    (keywords through the cache) and compared as a single keyword x window
+    cosine-similarity matrix.
+    """
     student_chunks = student_ans.lower().split()
 
     windows = []
@@ -32,13 +96,16 @@ def keyword_match(student_ans, rake_keywords, threshold=0.7):
     for i in range(len(student_chunks) - 2):
         windows.append(" ".join(student_chunks[i:i+3]))
 
-    for keyword in rake_keywords:
-        for chunk in windows:
-            score = get_similarity(chunk, keyword)
-            if score >= threshold:
-                matched.append(keyword)
-                break
-    return matched
+    if not windows or not rake_keywords:
+        return []
+
+    from sentence_transformers import util
+    model = get_model()
+    window_embeddings = model.encode(windows, convert_to_tensor=True)
+    keyword_embeddings = encode_cached(rake_keywords)
+    similarity = util.pytorch_cos_sim(keyword_embeddings, window_embeddings)
+    hits = (similarity >= threshold).any(dim=1).tolist()
+    return [keyword for keyword, hit in zip(rake_keywords, hits) if hit]
 
 def hybrid_grade(student_ans, correct_ans, min_match=1):
     keywords = extract_keywords(correct_ans)
@@ -66,7 +133,7 @@ def grade_question(student_ans, correct_ans, qtype="short"):
             else "Incorrect"
         ), 1.0, "Multiple choice"
     
-    elif qtype == "truefalse":
+    elif qtype in ("truefalse", "tf"):  # detect_type() returns "tf"
         return (
             "Correct" if student_ans.strip().lower() == correct_ans.strip().lower() 
             else "Incorrect"